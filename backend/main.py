@@ -3,7 +3,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database import engine, Base
 from models import user as user_model, chat as chat_model, paper as paper_model, docspace as docspace_model
-from routers import auth, chat, papers, tasks, docspace
+from routers import auth, chat, papers, tasks, docspace, metrics
+from utils.ingestion import ingestion_queue
+from utils.llm import async_client
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
@@ -29,6 +31,16 @@ app.include_router(chat.router)
 app.include_router(papers.router)
 app.include_router(tasks.router)
 app.include_router(docspace.router)
+app.include_router(metrics.router)
+
+@app.on_event("startup")
+async def start_background_workers():
+    await ingestion_queue.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await ingestion_queue.stop()
+    await async_client.close()
 
 @app.get("/")
 async def root():
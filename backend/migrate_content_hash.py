@@ -0,0 +1,33 @@
+import sqlite3
+import os
+
+db_path = "researchhub.db"
+
+def migrate():
+    if not os.path.exists(db_path):
+        print(f"Database {db_path} not found.")
+        return
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        # Check current columns
+        cursor.execute("PRAGMA table_info(papers)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if "content_hash" not in columns:
+            print("Adding 'content_hash' column to 'papers' table...")
+            cursor.execute("ALTER TABLE papers ADD COLUMN content_hash TEXT")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_papers_content_hash ON papers (content_hash)")
+            conn.commit()
+            print("content_hash column added.")
+        
+        # The paper_contents registry table itself is created by Base.metadata.create_all
+        conn.close()
+        print("Migration task completed.")
+    except Exception as e:
+        print(f"Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate()
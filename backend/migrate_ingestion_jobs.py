@@ -0,0 +1,43 @@
+import sqlite3
+import os
+
+db_path = "researchhub.db"
+
+# Columns added to ingestion_jobs after the table was first created
+NEW_COLUMNS = {
+    "kind": "TEXT DEFAULT 'upload'",
+    "worker_id": "TEXT",
+    "heartbeat_at": "REAL",
+}
+
+def migrate():
+    if not os.path.exists(db_path):
+        print(f"Database {db_path} not found.")
+        return
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        # Check current columns
+        cursor.execute("PRAGMA table_info(ingestion_jobs)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if not columns:
+            # Table does not exist yet - Base.metadata.create_all creates it complete
+            print("No 'ingestion_jobs' table - nothing to migrate.")
+            conn.close()
+            return
+        
+        for name, definition in NEW_COLUMNS.items():
+            if name not in columns:
+                print(f"Adding '{name}' column to 'ingestion_jobs' table...")
+                cursor.execute(f"ALTER TABLE ingestion_jobs ADD COLUMN {name} {definition}")
+        conn.commit()
+        
+        conn.close()
+        print("Migration task completed.")
+    except Exception as e:
+        print(f"Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate()
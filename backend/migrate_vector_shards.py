@@ -0,0 +1,73 @@
+import sqlite3
+import os
+from utils.vectordb import chroma_client, user_collection, copy_paper_chunks
+
+db_path = "researchhub.db"
+LEGACY_COLLECTION = "research_papers"
+PAGE_SIZE = 1000
+
+def migrate():
+    """Move chunks from the global research_papers collection into per-user collections"""
+    if not os.path.exists(db_path):
+        print(f"Database {db_path} not found.")
+        return
+
+    try:
+        legacy = chroma_client.get_collection(LEGACY_COLLECTION)
+    except Exception:
+        print(f"No '{LEGACY_COLLECTION}' collection - nothing to migrate.")
+        return
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, user_id FROM papers")
+        owners = dict(cursor.fetchall())
+
+        # Stored vectors are reused as-is, nothing is re-embedded
+        moved = 0
+        orphans = 0
+        offset = 0
+        while True:
+            page = legacy.get(include=["documents", "metadatas", "embeddings"], limit=PAGE_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            by_user = {}
+            for chunk_id, document, metadata, embedding in zip(page["ids"], page["documents"], page["metadatas"], page["embeddings"]):
+                user_id = owners.get(metadata.get("paper_id"))
+                if user_id is None:
+                    orphans += 1
+                    continue
+                by_user.setdefault(user_id, []).append((chunk_id, document, metadata, list(embedding)))
+            for user_id, rows in by_user.items():
+                user_collection(user_id).upsert(
+                    ids=[row[0] for row in rows],
+                    documents=[row[1] for row in rows],
+                    metadatas=[row[2] for row in rows],
+                    embeddings=[row[3] for row in rows]
+                )
+                moved += len(rows)
+            offset += len(page["ids"])
+        print(f"Moved {moved} chunks into per-user collections ({orphans} orphaned chunks skipped).")
+
+        # Deduplicated papers used to share their source paper's chunks - give each its own copy
+        cursor.execute("""
+            SELECT papers.id, papers.user_id, source.id, source.user_id
+            FROM papers
+            JOIN paper_contents ON paper_contents.content_hash = papers.content_hash
+            JOIN papers AS source ON source.id = paper_contents.source_paper_id
+            WHERE papers.id != source.id
+        """)
+        copies = cursor.fetchall()
+        for paper_id, user_id, source_paper_id, source_user_id in copies:
+            if not user_collection(user_id).get(where={"paper_id": paper_id}, limit=1)["ids"]:
+                copy_paper_chunks(source_user_id, source_paper_id, user_id, paper_id)
+        print(f"Checked {len(copies)} deduplicated papers for their own chunk copies.")
+
+        conn.close()
+        print(f"Migration task completed. The '{LEGACY_COLLECTION}' collection is no longer read and can be deleted.")
+    except Exception as e:
+        print(f"Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,228 @@
+"""Local stand-in for the Groq chat-completions API, for offline load testing.
+
+Run it, then point the backend at it:
+
+    python mock_groq_server.py            # listens on 127.0.0.1:8001
+    GROQ_BASE_URL=http://127.0.0.1:8001 uvicorn main:app
+
+Responses are deterministic for a given request and MOCK_SEED. Latency,
+rate limiting and errors are configured with the MOCK_* variables below.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from collections import deque
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+
+MOCK_HOST = os.getenv("MOCK_HOST", "127.0.0.1")
+MOCK_PORT = int(os.getenv("MOCK_PORT", 8001))
+MOCK_SEED = os.getenv("MOCK_SEED", "researchhub")
+
+# Time to first token: fixed | uniform | normal | lognormal
+MOCK_LATENCY_DIST = os.getenv("MOCK_LATENCY_DIST", "lognormal")
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", 400))
+MOCK_LATENCY_JITTER_MS = float(os.getenv("MOCK_LATENCY_JITTER_MS", 150))
+# Generation speed once the first token is out
+MOCK_TOKEN_LATENCY_MS = float(os.getenv("MOCK_TOKEN_LATENCY_MS", 2))
+
+# Requests per minute before answering 429 (0 = unlimited)
+MOCK_RATE_LIMIT_RPM = int(os.getenv("MOCK_RATE_LIMIT_RPM", 0))
+# Fraction of requests answered with 503
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", 0))
+
+RESEARCH_CATEGORIES = [
+    "Machine Learning", "Artificial Intelligence", "Climate Science", "Medical Research",
+    "Physics", "Chemistry", "Biology", "Computer Science", "Mathematics",
+    "Social Science", "Engineering", "Other"
+]
+
+WORDS = (
+    "model data analysis results method approach study performance training evaluation "
+    "dataset baseline accuracy significant experiment framework proposed network learning "
+    "observed effect sample features robust improvement compared previous findings research"
+).split()
+
+app = FastAPI(title="Mock Groq API")
+
+_request_times = deque()
+_error_rng = random.Random(f"{MOCK_SEED}:errors")
+
+def _request_rng(body: dict) -> random.Random:
+    """RNG seeded by the request, so identical requests get identical answers"""
+    canonical = json.dumps(
+        {k: body.get(k) for k in ("model", "messages", "temperature", "max_tokens", "response_format")},
+        sort_keys=True
+    )
+    return random.Random(f"{MOCK_SEED}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}")
+
+def _first_token_delay(rng: random.Random) -> float:
+    if MOCK_LATENCY_DIST == "fixed":
+        ms = MOCK_LATENCY_MS
+    elif MOCK_LATENCY_DIST == "uniform":
+        ms = rng.uniform(MOCK_LATENCY_MS - MOCK_LATENCY_JITTER_MS, MOCK_LATENCY_MS + MOCK_LATENCY_JITTER_MS)
+    elif MOCK_LATENCY_DIST == "normal":
+        ms = rng.gauss(MOCK_LATENCY_MS, MOCK_LATENCY_JITTER_MS)
+    else:
+        # Lognormal with the configured mean and standard deviation - long tail like real APIs
+        variance = (MOCK_LATENCY_JITTER_MS / MOCK_LATENCY_MS) ** 2 if MOCK_LATENCY_MS > 0 else 0
+        sigma = math.sqrt(math.log1p(variance))
+        mu = math.log(max(MOCK_LATENCY_MS, 1e-3)) - sigma ** 2 / 2
+        ms = rng.lognormvariate(mu, sigma)
+    return max(ms, 0) / 1000
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def _canned_content(body: dict, rng: random.Random) -> str:
+    """Answer in the format the calling feature parses"""
+    messages = body.get("messages", [])
+    system = " ".join(m["content"] for m in messages if m.get("role") == "system" and isinstance(m.get("content"), str))
+    max_words = max(1, int(body.get("max_tokens") or 1024) * 3 // 4)
+
+    if (body.get("response_format") or {}).get("type") == "json_object" and '"papers"' in system:
+        user = _prompt_text([m for m in messages if m.get("role") == "user"])
+        count = len(re.findall(r"^\[\d+\]", user, re.M))
+        return json.dumps({"papers": [
+            {"id": i + 1, "category": rng.choice(RESEARCH_CATEGORIES), "tags": rng.sample(WORDS, 4)}
+            for i in range(count)
+        ]})
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({
+            "title": f"Mock Paper {rng.randint(1, 9999)}",
+            "authors": "A. Author, B. Author",
+            "summary": " ".join(_sentence(rng, 12) for _ in range(4)),
+            "category": rng.choice(RESEARCH_CATEGORIES),
+            "tags": rng.sample(WORDS, 4),
+        })
+    if "Title: [title]" in system:
+        return f"Title: Mock Paper {rng.randint(1, 9999)}\nAuthors: A. Author, B. Author"
+    if "Category: [category]" in system:
+        return f"Category: {rng.choice(RESEARCH_CATEGORIES)}\nTags: {', '.join(rng.sample(WORDS, 4))}"
+    if "project name" in system:
+        return " ".join(word.capitalize() for word in rng.sample(WORDS, 3))
+
+    sentences = []
+    length = 0
+    target = min(max_words, rng.randint(60, 240))
+    while length < target:
+        words = rng.randint(8, 18)
+        sentences.append(_sentence(rng, words))
+        length += words
+    return " ".join(sentences)
+
+def _usage(body: dict, content: str, started: float) -> dict:
+    prompt_tokens = len(_prompt_text(body.get("messages", []))) // 4 + 4 * len(body.get("messages", []))
+    completion_tokens = max(1, len(content) // 4)
+    elapsed = time.time() - started
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "total_time": elapsed,
+    }
+
+def _error(status_code: int, message: str, error_type: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "code": error_type}},
+        headers=headers
+    )
+
+def _rate_limited():
+    """Sliding one-minute window over accepted requests"""
+    if MOCK_RATE_LIMIT_RPM <= 0:
+        return None
+    now = time.monotonic()
+    while _request_times and now - _request_times[0] >= 60:
+        _request_times.popleft()
+    if len(_request_times) >= MOCK_RATE_LIMIT_RPM:
+        retry_after = max(1, int(60 - (now - _request_times[0])) + 1)
+        return _error(429, "Rate limit reached for requests per minute (RPM)", "rate_limit_exceeded", {"retry-after": str(retry_after)})
+    _request_times.append(now)
+    return None
+
+@app.get("/openai/v1/models")
+def list_models():
+    models = ["llama-3.3-70b-versatile", "llama-3.1-8b-instant", "meta-llama/llama-4-scout-17b-16e-instruct"]
+    return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "mock", "created": 0} for m in models]}
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    started = time.time()
+
+    limited = _rate_limited()
+    if limited is not None:
+        return limited
+    if MOCK_ERROR_RATE and _error_rng.random() < MOCK_ERROR_RATE:
+        return _error(503, "Service unavailable (mock)", "service_unavailable")
+
+    rng = _request_rng(body)
+    content = _canned_content(body, rng)
+    completion_id = f"chatcmpl-{uuid.UUID(int=rng.getrandbits(128))}"
+    model = body.get("model", "llama-3.3-70b-versatile")
+    first_token_delay = _first_token_delay(rng)
+    token_delay = MOCK_TOKEN_LATENCY_MS / 1000
+
+    if not body.get("stream"):
+        await asyncio.sleep(first_token_delay + token_delay * (len(content) // 4))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(started),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+                "logprobs": None
+            }],
+            "usage": _usage(body, content, started),
+            "system_fingerprint": "fp_mock",
+            "x_groq": {"id": completion_id}
+        }
+
+    async def events():
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(started),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+                **extra
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        await asyncio.sleep(first_token_delay)
+        yield chunk({"role": "assistant", "content": ""})
+        # Roughly one token per piece
+        pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        for piece in pieces:
+            await asyncio.sleep(token_delay)
+            yield chunk({"content": piece})
+        yield chunk({}, "stop", x_groq={"id": completion_id, "usage": _usage(body, content, started)})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=MOCK_HOST, port=MOCK_PORT)
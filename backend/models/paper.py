@@ -2,6 +2,7 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float
 from sqlalchemy.sql import func
 from database import Base
+import json
 
 class Paper(Base):
     __tablename__ = "papers"
@@ -16,8 +17,47 @@ class Paper(Base):
     category = Column(String, nullable=True)  # AI-detected category (e.g., "Machine Learning", "Climate Science")
     tags = Column(Text, nullable=True)  # Comma-separated tags
     project_id = Column(Integer, ForeignKey("research_projects.id"), nullable=True)
+    content_hash = Column(String, index=True, nullable=True)  # SHA-256 of the uploaded file
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class PaperContent(Base):
+    """Processing artifacts shared by every paper uploaded with the same file bytes"""
+    __tablename__ = "paper_contents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, unique=True, index=True)
+    text_sample = Column(Text, nullable=True)  # Leading extracted text fed to the LLM
+    title = Column(String, nullable=True)
+    authors = Column(String, nullable=True)
+    summary = Column(Text, nullable=True)
+    category = Column(String, nullable=True)
+    tags = Column(Text, nullable=True)
+    source_paper_id = Column(Integer, ForeignKey("papers.id"), nullable=True)  # Paper the chunks are stored under
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    kind = Column(String, default="upload")
+    status = Column(String, default="queued")  # queued, running, completed, failed
+    stage = Column(String, nullable=True)  # Stage currently running
+    stage_state = Column(Text, nullable=True)  # JSON {stage: pending|running|done|failed}
+    file_path = Column(String, nullable=True)
+    file_name = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    paper_id = Column(Integer, ForeignKey("papers.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    worker_id = Column(String, nullable=True)  # "<host>:<pid>" of the process running the job
+    heartbeat_at = Column(Float, nullable=True)  # Epoch seconds of the owner's last heartbeat
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    @property
+    def stages(self) -> dict:
+        return json.loads(self.stage_state) if self.stage_state else {}
+
 class ResearchProject(Base):
     __tablename__ = "research_projects"
     
@@ -1,12 +1,19 @@
 <<<<<<< HEAD
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import base64
+import json
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, SessionLocal
 from models.chat import Chat, Message
 from models.user import User
 from schemas.chat import ChatCreate, ChatResponse, MessageCreate, MessageResponse, ChatWithMessages
-from utils.llm import research_assistant, analyze_research_trends, vision_assistant
+from utils.llm import (
+    research_assistant_async, analyze_research_trends_async, vision_assistant_async,
+    research_assistant_stream, vision_assistant_stream
+)
+from utils.image_processor import preprocess_image, image_hash as compute_image_hash
 from typing import List
 
 router = APIRouter(
@@ -52,23 +59,41 @@ def get_chat(chat_id: int, db: Session = Depends(get_db)):
         "messages": messages
     }
 
-@router.post("/{chat_id}/message", response_model=MessageResponse)
-def send_message(
-    chat_id: int, 
-    content: str = Form(None),
-    image: UploadFile = File(None),
-    db: Session = Depends(get_db)
-):
-    """Send a message and get AI response"""
+def _get_chat_or_404(db: Session, chat_id: int) -> Chat:
     chat = db.query(Chat).filter(Chat.id == chat_id).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+    return chat
+
+def _store_user_message(db: Session, chat_id: int, content: str, image_url: str):
+    """Blocking DB part of _save_user_message. Returns (previous_messages, context)"""
+    user_message = Message(chat_id=chat_id, role="user", content=content, image_url=image_url)
+    db.add(user_message)
+    db.commit()
+    db.refresh(user_message)
     
+    # Get chat history for context
+    # Timestamps have second resolution - the ID keeps same-second messages in order
+    previous_messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.timestamp, Message.id).all()
+    # The new message itself is sent as the query, so it is left out of the
+    # context - this also keeps the context stable for the semantic cache
+    history = [msg for msg in previous_messages if msg.id != user_message.id]
+    context = "\n".join([f"{msg.role}: {msg.content}" for msg in history[-4:] if msg.content])
+    return previous_messages, context
+
+async def _save_user_message(chat_id: int, content: str, image: UploadFile, db: Session):
+    """Store the user's message and build the context for the AI reply.
+
+    Returns (image_base64, image_hash, previous_messages, context).
+    """
     image_base64 = None
+    image_hash = None
     image_url = None
     if image:
         try:
-            image_data = image.file.read()
+            # Downscaled, EXIF-free JPEG - far smaller than a raw phone photo
+            image_data = await run_in_threadpool(preprocess_image, await image.read())
+            image_hash = compute_image_hash(image_data)
             image_base64 = base64.b64encode(image_data).decode('utf-8')
             # For this demo, we store the base64 string in the DB. 
             # In production, you'd upload to S3 and store the URL.
@@ -76,44 +101,116 @@ def send_message(
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Failed to process image: {str(e)}")
 
-    # Save user message
-    user_message = Message(chat_id=chat_id, role="user", content=content, image_url=image_url)
-    db.add(user_message)
+    # Save user message (sync session - off the event loop)
+    previous_messages, context = await run_in_threadpool(_store_user_message, db, chat_id, content, image_url)
+    return image_base64, image_hash, previous_messages, context
+
+def _save_assistant_message(chat: Chat, content: str, ai_response: str, is_first_exchange: bool, db: Session) -> Message:
+    """Store the AI reply and title the chat after its first message"""
+    assistant_message = Message(chat_id=chat.id, role="assistant", content=ai_response)
+    db.add(assistant_message)
     db.commit()
-    db.refresh(user_message)
+    db.refresh(assistant_message)
     
-    # Get chat history for context
-    previous_messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.timestamp).all()
-    context = "\n".join([f"{msg.role}: {msg.content}" for msg in previous_messages[-5:] if msg.content])  # Last 5 messages
+    # Update chat title if it's the first message
+    if is_first_exchange:
+        title_source = content or "Image Analysis"
+        chat.title = title_source[:50] + "..." if len(title_source) > 50 else title_source
+        db.commit()
+    
+    return assistant_message
+
+@router.post("/{chat_id}/message", response_model=MessageResponse)
+async def send_message(
+    chat_id: int, 
+    content: str = Form(None),
+    image: UploadFile = File(None),
+    db: Session = Depends(get_db)
+):
+    """Send a message and get AI response"""
+    chat = await run_in_threadpool(_get_chat_or_404, db, chat_id)
+    
+    image_base64, image_hash, previous_messages, context = await _save_user_message(chat_id, content, image, db)
     
     # Get AI response
     try:
         if image_base64:
-            ai_response = vision_assistant(content or "Analyze this image.", image_base64, context=context)
+            ai_response = await vision_assistant_async(content or "Analyze this image.", image_base64, context=context, image_hash=image_hash)
         else:
-            ai_response = research_assistant(content, context=context)
+            ai_response = await research_assistant_async(content, context=context, user_id=chat.user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI Error: {str(e)}")
     
-    # Save AI response
-    assistant_message = Message(chat_id=chat_id, role="assistant", content=ai_response)
-    db.add(assistant_message)
-    db.commit()
-    db.refresh(assistant_message)
+    # Only user message exists -> first exchange
+    return await run_in_threadpool(_save_assistant_message, chat, content, ai_response, len(previous_messages) == 1, db)
+
+def _sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def _save_streamed_reply(chat_id: int, content: str, ai_response: str, is_first_exchange: bool) -> dict:
+    """Save a streamed reply with its own session - the request-scoped one may be closed by now"""
+    stream_db = SessionLocal()
+    try:
+        stream_chat = _get_chat_or_404(stream_db, chat_id)
+        assistant_message = _save_assistant_message(stream_chat, content, ai_response, is_first_exchange, stream_db)
+        return MessageResponse.model_validate(assistant_message).model_dump(mode="json")
+    finally:
+        stream_db.close()
+
+@router.post("/{chat_id}/message/stream")
+async def send_message_stream(
+    chat_id: int,
+    request: Request,
+    content: str = Form(None),
+    image: UploadFile = File(None),
+    db: Session = Depends(get_db)
+):
+    """Send a message and stream the AI response as Server-Sent Events.
+
+    Emits `data: {"delta": ...}` per token batch, then an `event: done` with the
+    saved assistant message, or an `event: error`. The message is only saved
+    once the stream completes; a client disconnect cancels the Groq request.
+    """
+    chat = await run_in_threadpool(_get_chat_or_404, db, chat_id)
     
-    # Update chat title if it's the first message
-    if len(previous_messages) == 1:  # Only user message exists
-        title_source = content or "Image Analysis"
-        chat.title = title_source[:50] + "..." if len(title_source) > 50 else title_source
-        db.commit()
+    image_base64, image_hash, previous_messages, context = await _save_user_message(chat_id, content, image, db)
+    is_first_exchange = len(previous_messages) == 1
     
-    return assistant_message
+    if image_base64:
+        tokens = vision_assistant_stream(content or "Analyze this image.", image_base64, context=context, image_hash=image_hash)
+    else:
+        tokens = research_assistant_stream(content, context=context, user_id=chat.user_id)
+    
+    async def event_stream():
+        parts = []
+        try:
+            async for delta in tokens:
+                if await request.is_disconnected():
+                    return
+                parts.append(delta)
+                yield _sse_event({"delta": delta})
+        except Exception as e:
+            yield _sse_event({"detail": f"AI Error: {str(e)}"}, event="error")
+            return
+        finally:
+            # Closes the upstream Groq stream if we stopped early or were cancelled
+            await tokens.aclose()
+        
+        saved = await run_in_threadpool(_save_streamed_reply, chat_id, content, "".join(parts), is_first_exchange)
+        yield _sse_event(saved, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/analyze-trends")
-def analyze_trends(query: dict, db: Session = Depends(get_db)):
+async def analyze_trends(query: dict, db: Session = Depends(get_db)):
     """Analyze research trends based on query"""
     try:
-        result = analyze_research_trends(query.get("query", ""))
+        result = await analyze_research_trends_async(query.get("query", ""))
         return {"analysis": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis Error: {str(e)}")
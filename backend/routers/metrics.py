@@ -0,0 +1,71 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.llm_cache import response_cache
+from utils.llm import llm_flights, async_llm_flights
+from utils.llm_scheduler import llm_scheduler
+from utils.token_budget import token_usage
+from utils.model_router import route_stats
+from utils.semantic_cache import semantic_cache
+from utils.embeddings import embedding_stats
+from utils.vectordb import bm25_stats
+from utils.metrics import registry
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+@router.get("", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """LLM latency / token / error histograms, queue waits, retries and PDF timings in Prometheus text format"""
+    return registry.render()
+
+@router.get("/summary")
+def get_metrics_summary():
+    """The same metrics as JSON, with approximate p50 / p95 per series"""
+    return registry.snapshot()
+
+@router.get("/llm-cache")
+def get_llm_cache_stats():
+    """Hit / miss counters of the LLM response cache, overall and per call site"""
+    return response_cache.stats()
+
+@router.get("/llm-singleflight")
+def get_llm_singleflight_stats():
+    """How many LLM requests were coalesced onto an identical in-flight request"""
+    return {
+        "sync": llm_flights.stats(),
+        "async": async_llm_flights.stats()
+    }
+
+@router.get("/llm-scheduler")
+def get_llm_scheduler_stats():
+    """Queue depth per priority class, wait times, retries and remaining rate-limit budget"""
+    return llm_scheduler.stats()
+
+@router.get("/llm-tokens")
+def get_llm_token_stats():
+    """Prompt / completion tokens per call site and how much content budgets trimmed"""
+    return token_usage.stats()
+
+@router.get("/llm-routes")
+def get_llm_route_stats():
+    """Model routing table with latency (p50/p95), SLO misses and errors per task and model"""
+    return route_stats.stats()
+
+@router.get("/semantic-cache")
+def get_semantic_cache_stats():
+    """Hit rate, near misses and size of the research assistant's semantic answer cache"""
+    if semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_cache.stats()}
+
+@router.get("/embeddings")
+def get_embedding_stats():
+    """Local embedding engine throughput (chunks/sec)"""
+    return embedding_stats.stats()
+
+@router.get("/bm25")
+def get_bm25_stats():
+    """Keyword index size, memory, build time and query p50/p95 per user"""
+    return bm25_stats()
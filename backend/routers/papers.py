@@ -1,20 +1,25 @@
 <<<<<<< HEAD
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Body, Form
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from database import get_db
-from models.paper import Paper
-from schemas.paper import PaperResponse
+from models.paper import Paper, PaperContent, IngestionJob
+from schemas.paper import PaperResponse, IngestionJobResponse, BatchUploadResponse
 from utils.pdf_processor import (
-    extract_text_from_pdf, chunk_text, summarize_text, 
-    extract_metadata_from_pdf, generate_synthesized_report,
-    create_docx_report, create_pdf_report,
-    extract_category_and_tags, detect_common_theme
+    generate_synthesized_report_async, create_docx_report, create_pdf_report, detect_common_theme_async
+)
+from utils.vectordb import search_papers, hybrid_search, delete_paper_from_vectordb
+from utils.content_registry import (
+    save_upload_with_hash, get_registered_content, release_content
+)
+from utils.ingestion import (
+    create_job, create_recategorize_job, complete_job_from_content, ingest_batch_file, ingestion_queue
 )
-from utils.vectordb import add_paper_to_vectordb, search_papers, delete_paper_from_vectordb
 from typing import List, Optional
+import asyncio
 import os
-import shutil
+import uuid
 
 router = APIRouter(
     prefix="/papers",
@@ -24,57 +29,58 @@ router = APIRouter(
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# How many files of one /upload-batch request are processed at the same time
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 4))
+
 def get_current_user_id():
     return 1  # Mock user ID
 
-@router.post("/upload", response_model=PaperResponse)
+def _upload_path(user_id: int, file_name: str) -> str:
+    """Unique path per upload - files are processed later, so a re-upload must not overwrite a queued one"""
+    return os.path.join(UPLOAD_DIR, f"{user_id}_{uuid.uuid4().hex}_{os.path.basename(file_name)}")
+
+@router.post("/upload", response_model=IngestionJobResponse, status_code=202)
 async def upload_paper(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Upload a PDF research paper"""
+    """Upload a PDF research paper; processing runs in the background"""
     user_id = get_current_user_id()
     
     # Validate file type
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Save file
-    file_path = os.path.join(UPLOAD_DIR, f"{user_id}_{file.filename}")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save file, hashing it as it streams to disk (off the event loop)
+    file_path = _upload_path(user_id, file.filename)
+    content_hash = await run_in_threadpool(save_upload_with_hash, file.file, file_path)
     
-    try:
-        # Extract text
-        text = extract_text_from_pdf(file_path)
-        
-        # Extract metadata
-        metadata = extract_metadata_from_pdf(text)
-        
-        # Generate summary
-        summary = summarize_text(text)
-        
-        # Create paper record
-        paper = Paper(
-            user_id=user_id,
-            title=metadata['title'],
-            authors=metadata['authors'],
-            file_path=file_path,
-            file_name=file.filename,
-            summary=summary
-        )
-        db.add(paper)
-        db.commit()
-        db.refresh(paper)
-        
-        # Chunk text and add to vector database
-        chunks = chunk_text(text)
-        metadatas = [{"paper_id": paper.id, "chunk_index": i} for i in range(len(chunks))]
-        add_paper_to_vectordb(paper.id, chunks, metadatas)
-        
-        return paper
-    except Exception as e:
-        # Clean up file if processing fails
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+    job = await run_in_threadpool(create_job, db, user_id, file_path, file.filename, content_hash)
+    
+    # Same bytes were processed before: reuse the stored results, nothing to queue
+    content = await run_in_threadpool(get_registered_content, db, content_hash)
+    if content:
+        # Copies the stored vectors into this user's collection - keep it off the event loop
+        try:
+            return await run_in_threadpool(complete_job_from_content, db, job, content)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    await ingestion_queue.enqueue(job.id)
+    return job
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+def get_ingestion_job(job_id: int, db: Session = Depends(get_db)):
+    """Get the progress of a background ingestion job"""
+    job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/recategorize", response_model=IngestionJobResponse, status_code=202)
+async def recategorize_library(db: Session = Depends(get_db)):
+    """Re-tag every paper in the library in the background with batched LLM calls"""
+    user_id = get_current_user_id()
+    job = await run_in_threadpool(create_recategorize_job, db, user_id)
+    await ingestion_queue.enqueue(job.id)
+    return job
 
 @router.get("/", response_model=List[PaperResponse])
 def get_papers(db: Session = Depends(get_db)):
@@ -102,8 +108,19 @@ def delete_paper(paper_id: int, db: Session = Depends(get_db)):
     if os.path.exists(paper.file_path):
         os.remove(paper.file_path)
     
-    # Delete from vector database
-    delete_paper_from_vectordb(paper_id)
+    # Delete from vector database; papers sharing the content keep their own copies
+    release_content(db, paper)
+    delete_paper_from_vectordb(paper.user_id, paper_id)
+    
+    # Keep the ingestion job history, but without a foreign key to the deleted row.
+    # release_content has already moved shared content to another paper; clear
+    # any registry row still naming this one for the same reason.
+    db.query(IngestionJob).filter(IngestionJob.paper_id == paper_id).update(
+        {IngestionJob.paper_id: None}, synchronize_session=False
+    )
+    db.query(PaperContent).filter(PaperContent.source_paper_id == paper_id).update(
+        {PaperContent.source_paper_id: None}, synchronize_session=False
+    )
     
     # Delete from database
     db.delete(paper)
@@ -111,11 +128,42 @@ def delete_paper(paper_id: int, db: Session = Depends(get_db)):
     
     return {"message": "Paper deleted successfully"}
 
+def _filtered_paper_ids(db: Session, user_id: int, query: dict):
+    """IDs of the user's papers matching the optional project_id / category / tag filters, or None if unfiltered"""
+    if query.get("project_id") is None and not query.get("category") and not query.get("tag"):
+        return None
+
+    papers = db.query(Paper.id, Paper.tags).filter(Paper.user_id == user_id)
+    if query.get("project_id") is not None:
+        papers = papers.filter(Paper.project_id == query["project_id"])
+    if query.get("category"):
+        papers = papers.filter(Paper.category == query["category"])
+    tag = (query.get("tag") or "").strip().lower()
+    if tag:
+        papers = papers.filter(Paper.tags.ilike(f"%{tag}%"))
+        # ilike also matches substrings of longer tags - keep exact tag matches only
+        return [
+            paper_id for paper_id, tags in papers.all()
+            if tag in (t.strip().lower() for t in (tags or "").split(","))
+        ]
+    return [paper_id for paper_id, _ in papers.all()]
+
 @router.post("/search")
 def search_in_papers(query: dict, db: Session = Depends(get_db)):
-    """Search across all papers using vector similarity"""
+    """Search the current user's papers using vector similarity.
+
+    mode "hybrid" adds BM25 keyword search, fused by reciprocal rank, for
+    exact terms like gene names or dataset IDs. Optional filters: project_id,
+    category and tag.
+    """
+    user_id = get_current_user_id()
+    mode = query.get("mode", "vector")
+    if mode not in ("vector", "hybrid"):
+        raise HTTPException(status_code=400, detail="mode must be 'vector' or 'hybrid'")
     try:
-        results = search_papers(query.get("query", ""), n_results=5)
+        paper_ids = _filtered_paper_ids(db, user_id, query)
+        search = hybrid_search if mode == "hybrid" else search_papers
+        results = search(user_id, query.get("query", ""), n_results=5, paper_ids=paper_ids)
         return {
             "query": query.get("query"),
             "results": results
@@ -123,95 +171,85 @@ def search_in_papers(query: dict, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
-@router.post("/upload-batch", response_model=List[PaperResponse])
+@router.post("/upload-batch", response_model=BatchUploadResponse)
 async def upload_batch(
     files: List[UploadFile] = File(...), 
     titles: List[str] = Form(...),
     db: Session = Depends(get_db)
 ):
     """Upload multiple PDF research papers with AI-powered organization"""
-    from models.paper import ResearchProject
-    
     user_id = get_current_user_id()
-    results = []
-    paper_summaries = []
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
     
-    # First pass: Process all files
-    for i, file in enumerate(files):
+    async def process_file(i: int, file: UploadFile) -> dict:
         title = titles[i] if i < len(titles) else file.filename
         if not file.filename.endswith('.pdf'):
-            continue
-            
-        file_path = os.path.join(UPLOAD_DIR, f"{user_id}_{file.filename}")
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        try:
-            print(f"Processing file: {file.filename}")
-            text = extract_text_from_pdf(file_path)
-            metadata = extract_metadata_from_pdf(text)
-            summary = summarize_text(text)
-            
-            # AI-powered categorization and tagging
-            cat_tags = extract_category_and_tags(text, summary)
-            
-            paper = Paper(
-                user_id=user_id,
-                title=title,
-                authors=metadata['authors'],
-                file_path=file_path,
-                file_name=file.filename,
-                summary=summary,
-                category=cat_tags['category'],
-                tags=cat_tags['tags']
-            )
-            db.add(paper)
-            db.commit()
-            db.refresh(paper)
-            
-            chunks = chunk_text(text)
-            metadatas = [{"paper_id": paper.id, "chunk_index": i} for i in range(len(chunks))]
-            add_paper_to_vectordb(paper.id, chunks, metadatas)
-            
-            results.append(paper)
-            paper_summaries.append(summary)
-        except Exception as e:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            print(f"Failed to process {file.filename}: {str(e)}")
-            continue
+            return {"file_name": file.filename, "status": "skipped", "error": "Only PDF files are allowed"}
+        
+        # Files of one batch are written concurrently - same-named files must not share a path
+        file_path = _upload_path(user_id, file.filename)
+        async with semaphore:
+            try:
+                print(f"Processing file: {file.filename}")
+                paper_id, reused = await run_in_threadpool(
+                    ingest_batch_file, user_id, file.file, file_path, file.filename, title
+                )
+                return {"file_name": file.filename, "status": "reused" if reused else "processed", "paper_id": paper_id}
+            except Exception as e:
+                print(f"Failed to process {file.filename}: {str(e)}")
+                return {"file_name": file.filename, "status": "failed", "error": str(e)}
+    
+    # First pass: Process files concurrently, at most BATCH_UPLOAD_CONCURRENCY at a time
+    file_results = await asyncio.gather(*(process_file(i, file) for i, file in enumerate(files)))
+    
+    paper_ids = [r["paper_id"] for r in file_results if r.get("paper_id")]
+    results = await run_in_threadpool(_papers_in_order, db, paper_ids)
+    paper_summaries = [paper.summary for paper in results]
+    project_id = None
     
     # Second pass: Group related papers into a project if multiple files uploaded
     if len(results) > 1:
         try:
             # Detect common theme
-            project_name = detect_common_theme(paper_summaries)
-            
-            # Create or find project
-            project = ResearchProject(
-                user_id=user_id,
-                name=project_name,
-                description=f"Auto-generated project from {len(results)} uploaded papers"
-            )
-            db.add(project)
-            db.commit()
-            db.refresh(project)
-            
-            # Associate all papers with this project
-            for paper in results:
-                paper.project_id = project.id
-            db.commit()
-            
+            project_name = await detect_common_theme_async(paper_summaries)
+            project_id = await run_in_threadpool(_group_into_project, db, user_id, project_name, results)
             print(f"Created project '{project_name}' with {len(results)} papers")
         except Exception as e:
             print(f"Project grouping failed: {str(e)}")
-            
-    return results
+    
+    return {"papers": results, "results": file_results, "project_id": project_id}
+
+def _papers_in_order(db: Session, paper_ids: List[int]) -> List[PaperResponse]:
+    """Load papers by ID, keeping the order of paper_ids"""
+    papers_by_id = {p.id: p for p in db.query(Paper).filter(Paper.id.in_(paper_ids)).all()}
+    return [PaperResponse.model_validate(papers_by_id[paper_id]) for paper_id in paper_ids if paper_id in papers_by_id]
+
+def _group_into_project(db: Session, user_id: int, project_name: str, papers: List[PaperResponse]) -> int:
+    """Create a project for a batch of papers and move the papers into it. Returns the project ID"""
+    from models.paper import ResearchProject
+    
+    project = ResearchProject(
+        user_id=user_id,
+        name=project_name,
+        description=f"Auto-generated project from {len(papers)} uploaded papers"
+    )
+    db.add(project)
+    db.commit()
+    db.refresh(project)
+    
+    # Associate all papers with this project
+    db.query(Paper).filter(Paper.id.in_([paper.id for paper in papers])).update(
+        {Paper.project_id: project.id}, synchronize_session=False
+    )
+    db.commit()
+    for paper in papers:
+        paper.project_id = project.id
+    return project.id
 
 @router.post("/synthesize-report")
-def synthesize_report(paper_ids: List[int] = Body(...), db: Session = Depends(get_db)):
+async def synthesize_report(paper_ids: List[int] = Body(...), db: Session = Depends(get_db)):
     """Synthesize a report from multiple papers"""
-    papers = db.query(Paper).filter(Paper.id.in_(paper_ids)).all()
+    papers = await run_in_threadpool(lambda: db.query(Paper).filter(Paper.id.in_(paper_ids)).all())
     if not papers:
         raise HTTPException(status_code=404, detail="No papers found")
     
@@ -220,7 +258,7 @@ def synthesize_report(paper_ids: List[int] = Body(...), db: Session = Depends(ge
     if not summaries:
         raise HTTPException(status_code=400, detail="No summaries available to synthesize")
         
-    report = generate_synthesized_report(summaries)
+    report = await generate_synthesized_report_async(summaries)
     return {"report": report}
 
 @router.post("/export")
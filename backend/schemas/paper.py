@@ -1,6 +1,6 @@
 <<<<<<< HEAD
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, List
 from datetime import datetime
 
 class PaperUpload(BaseModel):
@@ -22,6 +22,32 @@ class PaperResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BatchFileResult(BaseModel):
+    file_name: str
+    status: str  # processed, reused, skipped, failed
+    paper_id: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    papers: List[PaperResponse]
+    results: List[BatchFileResult]
+    project_id: Optional[int] = None
+
+class IngestionJobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    stage: Optional[str]
+    stages: Dict[str, str]
+    file_name: Optional[str]
+    paper_id: Optional[int]
+    error: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
 class TaskCreate(BaseModel):
     title: str
     description: Optional[str] = None
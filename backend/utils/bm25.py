@@ -0,0 +1,195 @@
+import math
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, deque
+from utils.metrics import registry
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Rebuild the postings once this share of indexed chunks has been deleted
+COMPACT_DEAD_RATIO = 0.25
+
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+bm25_query_seconds = registry.histogram("bm25_query_seconds", "BM25 keyword query latency", QUERY_BUCKETS)
+bm25_build_seconds = registry.histogram("bm25_build_seconds", "Time to build a user's BM25 index from the vector store")
+
+# Keeps exact technical terms intact: gene names (BRCA1, IL-6), dataset IDs
+# (GSE12345), versions (v2.1) and symbols joined by _ . - / ^
+_TOKEN = re.compile(r"\w+(?:[-_./^]\w+)*")
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        # Also index the parts, so "IL-6" is found by "il-6" and by "il 6"
+        if len(token) > 1 and any(c in token for c in "-_./^"):
+            tokens.extend(part for part in re.split(r"[-_./^]", token) if part)
+    return tokens
+
+class BM25Index:
+    """Incremental in-memory inverted index over one user's chunks.
+
+    Postings are compact arrays of (document number, term frequency).
+    Deleted chunks are only marked dead and skipped at query time; the
+    postings are compacted once enough of them pile up. Document frequencies
+    keep counting dead chunks until then, which shifts IDF slightly.
+    """
+
+    def __init__(self):
+        # Re-entrant so the builder can hold it across its add() calls
+        self.lock = threading.RLock()
+        self.postings = {}  # term -> (array of doc numbers, array of term frequencies)
+        self.chunk_ids = []  # doc number -> chunk ID
+        self.doc_numbers = {}  # chunk ID -> doc number of its live version
+        self.doc_lengths = array("I")
+        self.doc_papers = array("q")
+        self.alive = bytearray()
+        self.paper_docs = {}  # paper ID -> set of doc numbers
+        self.live_docs = 0
+        self.live_length = 0
+        self.build_seconds = None
+        self.latencies = deque(maxlen=500)
+
+    def _remove_doc(self, doc: int):
+        if self.alive[doc]:
+            self.alive[doc] = 0
+            self.live_docs -= 1
+            self.live_length -= self.doc_lengths[doc]
+            del self.doc_numbers[self.chunk_ids[doc]]
+            self.paper_docs.get(self.doc_papers[doc], set()).discard(doc)
+
+    def add(self, chunk_ids: list[str], texts: list[str], paper_ids: list[int]):
+        """Index chunks; a chunk ID indexed before is replaced"""
+        with self.lock:
+            for chunk_id, text, paper_id in zip(chunk_ids, texts, paper_ids):
+                if chunk_id in self.doc_numbers:
+                    self._remove_doc(self.doc_numbers[chunk_id])
+                doc = len(self.chunk_ids)
+                terms = Counter(tokenize(text))
+                self.chunk_ids.append(chunk_id)
+                self.doc_numbers[chunk_id] = doc
+                length = sum(terms.values())
+                self.doc_lengths.append(length)
+                self.doc_papers.append(paper_id)
+                self.alive.append(1)
+                self.paper_docs.setdefault(paper_id, set()).add(doc)
+                self.live_docs += 1
+                self.live_length += length
+                for term, tf in terms.items():
+                    entry = self.postings.get(term)
+                    if entry is None:
+                        entry = self.postings[term] = (array("I"), array("I"))
+                    entry[0].append(doc)
+                    entry[1].append(tf)
+
+    def remove_paper(self, paper_id: int):
+        with self.lock:
+            for doc in list(self.paper_docs.pop(paper_id, ())):
+                self._remove_doc(doc)
+            if len(self.chunk_ids) - self.live_docs > COMPACT_DEAD_RATIO * max(len(self.chunk_ids), 1):
+                self._compact()
+
+    def _compact(self):
+        """Renumber the live documents and drop dead postings"""
+        renumber = {}
+        chunk_ids, lengths, papers = [], array("I"), array("q")
+        for doc, chunk_id in enumerate(self.chunk_ids):
+            if self.alive[doc]:
+                renumber[doc] = len(chunk_ids)
+                chunk_ids.append(chunk_id)
+                lengths.append(self.doc_lengths[doc])
+                papers.append(self.doc_papers[doc])
+
+        postings = {}
+        for term, (docs, tfs) in self.postings.items():
+            new_docs, new_tfs = array("I"), array("I")
+            for doc, tf in zip(docs, tfs):
+                if doc in renumber:
+                    new_docs.append(renumber[doc])
+                    new_tfs.append(tf)
+            if new_docs:
+                postings[term] = (new_docs, new_tfs)
+
+        self.postings = postings
+        self.chunk_ids = chunk_ids
+        self.doc_lengths = lengths
+        self.doc_papers = papers
+        self.alive = bytearray(b"\x01" * len(chunk_ids))
+        self.doc_numbers = {chunk_id: doc for doc, chunk_id in enumerate(chunk_ids)}
+        self.paper_docs = {}
+        for doc, paper_id in enumerate(papers):
+            self.paper_docs.setdefault(paper_id, set()).add(doc)
+
+    def search(self, query: str, n_results: int = 5, paper_ids: list[int] = None) -> list[tuple[str, float]]:
+        """Top (chunk ID, score) pairs for the query, optionally limited to some papers"""
+        started = time.monotonic()
+        with self.lock:
+            if not self.live_docs:
+                return []
+            allowed = None
+            if paper_ids is not None:
+                allowed = set()
+                for paper_id in paper_ids:
+                    allowed |= self.paper_docs.get(paper_id, set())
+
+            total = len(self.chunk_ids)
+            avg_length = self.live_length / self.live_docs
+            scores = {}
+            for term in set(tokenize(query)):
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                docs, tfs = entry
+                idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc, tf in zip(docs, tfs):
+                    if not self.alive[doc] or (allowed is not None and doc not in allowed):
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc] / avg_length)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+            results = [(self.chunk_ids[doc], score) for doc, score in top]
+
+        seconds = time.monotonic() - started
+        bm25_query_seconds.observe(seconds)
+        with self.lock:
+            self.latencies.append(seconds)
+        return results
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the index structures"""
+        with self.lock:
+            size = sys.getsizeof(self.postings) + sys.getsizeof(self.doc_numbers) + sys.getsizeof(self.chunk_ids)
+            for term, (docs, tfs) in self.postings.items():
+                size += sys.getsizeof(term) + sys.getsizeof(docs) + sys.getsizeof(tfs)
+            size += sum(sys.getsizeof(chunk_id) for chunk_id in self.chunk_ids)
+            size += sys.getsizeof(self.doc_lengths) + sys.getsizeof(self.doc_papers) + sys.getsizeof(self.alive)
+            size += sum(sys.getsizeof(docs) for docs in self.paper_docs.values())
+            return size
+
+    def stats(self) -> dict:
+        memory = self.memory_bytes()
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                "chunks": self.live_docs,
+                "dead_chunks": len(self.chunk_ids) - self.live_docs,
+                "terms": len(self.postings),
+                "memory_bytes": memory,
+                "build_seconds": round(self.build_seconds, 3) if self.build_seconds is not None else None,
+                "queries": len(latencies),
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+                "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+            }
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuse ranked ID lists: each list adds 1 / (k + rank) to an ID's score"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
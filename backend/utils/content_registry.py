@@ -0,0 +1,106 @@
+import hashlib
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.paper import Paper, PaperContent
+from utils.vectordb import copy_paper_chunks, delete_paper_from_vectordb
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def save_upload_with_hash(source, file_path: str) -> str:
+    """Copy an uploaded file to disk, hashing it on the way. Returns the SHA-256 hex digest"""
+    sha256 = hashlib.sha256()
+    with open(file_path, "wb") as buffer:
+        while True:
+            block = source.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            sha256.update(block)
+            buffer.write(block)
+    return sha256.hexdigest()
+
+def get_registered_content(db: Session, content_hash: str):
+    """Look up previously processed content by file hash"""
+    return db.query(PaperContent).filter(PaperContent.content_hash == content_hash).first()
+
+def register_content(db: Session, content_hash: str, paper: Paper, text_sample: str, title: str = None):
+    """Record the artifacts produced for a newly processed file"""
+    content = PaperContent(
+        content_hash=content_hash,
+        text_sample=text_sample,
+        title=title or paper.title,
+        authors=paper.authors,
+        summary=paper.summary,
+        category=paper.category,
+        tags=paper.tags,
+        source_paper_id=paper.id
+    )
+    db.add(content)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Same bytes were processed concurrently; the first registration wins
+        db.rollback()
+        return get_registered_content(db, content_hash)
+    db.refresh(content)
+    return content
+
+def create_paper_from_content(db: Session, content: PaperContent, user_id: int, file_path: str, file_name: str, title: str = None) -> Paper:
+    """Create a paper row that reuses already processed content - no extraction, LLM or embedding.
+
+    The stored vectors are copied into the new owner's collection. If that
+    fails the paper row and any chunks already copied are removed again.
+    """
+    paper = Paper(
+        user_id=user_id,
+        title=title or content.title,
+        authors=content.authors,
+        file_path=file_path,
+        file_name=file_name,
+        summary=content.summary,
+        category=content.category,
+        tags=content.tags,
+        content_hash=content.content_hash
+    )
+    db.add(paper)
+    db.commit()
+    db.refresh(paper)
+
+    try:
+        source = db.query(Paper).filter(Paper.id == content.source_paper_id).first()
+        if source is not None:
+            copy_paper_chunks(source.user_id, source.id, user_id, paper.id)
+    except Exception:
+        db.rollback()
+        delete_paper_from_vectordb(user_id, paper.id)
+        db.delete(paper)
+        db.commit()
+        raise
+    return paper
+
+def release_content(db: Session, paper: Paper) -> bool:
+    """Detach a paper that is about to be deleted from its shared content.
+
+    Returns True when the paper was the last one using the content. Every
+    paper has its own copy of the chunks, so the caller deletes the paper's
+    chunks either way.
+    """
+    if not paper.content_hash:
+        return True
+
+    content = get_registered_content(db, paper.content_hash)
+    other = db.query(Paper).filter(
+        Paper.content_hash == paper.content_hash,
+        Paper.id != paper.id
+    ).first()
+
+    if other is None:
+        if content:
+            db.delete(content)
+            db.flush()
+        return True
+
+    # Later duplicates copy their chunks from a paper that is still around
+    if content and content.source_paper_id == paper.id:
+        content.source_paper_id = other.id
+        db.flush()
+    return False
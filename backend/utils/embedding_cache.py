@@ -0,0 +1,120 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+
+# Rows added to the vector file each time it fills up
+_GROW_ROWS = 4096
+
+def normalize_chunk(text: str) -> str:
+    """Unicode NFC with whitespace collapsed, so re-extracted text still matches"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_chunk(text).encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Persistent chunk embeddings keyed by (model id, normalized chunk hash).
+
+    Each model gets a directory holding vectors.f32, a memory-mapped float32
+    array with one row per cached chunk, and index.tsv, an append-only list of
+    "hash<TAB>row" lines. Rows are flushed before their index line is written,
+    so a crash never leaves the index pointing at missing data. Meant for a
+    single process - the embedding pool workers never touch it.
+    """
+
+    def __init__(self, model: str, directory: str = EMBEDDING_CACHE_DIR):
+        self.model = model
+        self.path = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.index_path = os.path.join(self.path, "index.tsv")
+        self.lock = threading.Lock()
+        self.index = {}
+        self.dim = None
+        self.vectors = None
+        self.counters = {"hits": 0, "misses": 0, "stores": 0}
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            header = f.readline().split()
+            if len(header) != 2 or header[0] != "dim":
+                return
+            self.dim = int(header[1])
+            for line in f:
+                parts = line.split("\t")
+                if len(parts) == 2:
+                    self.index[parts[0]] = int(parts[1])
+        self._open(len(self.index))
+
+    def _open(self, min_rows: int):
+        """Map the vector file, growing it to hold at least min_rows rows"""
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = size // row_bytes
+        if rows < min_rows or rows == 0:
+            rows = max(min_rows, rows) + _GROW_ROWS
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def get_many(self, hashes: list[str]) -> list:
+        """Cached vector (as a list) for each hash, or None where missing"""
+        with self.lock:
+            found = []
+            for digest in hashes:
+                row = self.index.get(digest)
+                found.append(self.vectors[row].tolist() if row is not None else None)
+            hits = sum(vector is not None for vector in found)
+            self.counters["hits"] += hits
+            self.counters["misses"] += len(found) - hits
+            return found
+
+    def set_many(self, hashes: list[str], vectors: list[list[float]]):
+        with self.lock:
+            new = [(digest, vector) for digest, vector in zip(hashes, vectors) if digest not in self.index]
+            # Duplicate chunks within one batch only need one row
+            new = list(dict(new).items())
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = len(new[0][1])
+                with open(self.index_path, "w") as f:
+                    f.write(f"dim {self.dim}\n")
+            start = len(self.index)
+            if self.vectors is None or start + len(new) > self.vectors.shape[0]:
+                if self.vectors is not None:
+                    self.vectors.flush()
+                    self.vectors = None
+                self._open(start + len(new))
+
+            for offset, (_, vector) in enumerate(new):
+                self.vectors[start + offset] = vector
+            self.vectors.flush()
+            with open(self.index_path, "a") as f:
+                for offset, (digest, _) in enumerate(new):
+                    f.write(f"{digest}\t{start + offset}\n")
+                    self.index[digest] = start + offset
+            self.counters["stores"] += len(new)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.index),
+                "dim": self.dim,
+                "disk_bytes": os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0,
+            }
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from utils.metrics import registry
+from utils.embedding_cache import EMBEDDING_CACHE_ENABLED, EmbeddingCache, chunk_hash
+
+load_dotenv()
+
+# Same model Chroma uses by default, so existing vectors stay comparable
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+# 0 embeds in this process; N > 0 uses a dedicated pool of N processes
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", 0))
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE") or None
+
+try:
+    import sentence_transformers  # noqa: F401 - only checking it is installed
+    EMBEDDINGS_AVAILABLE = True
+except ImportError:
+    EMBEDDINGS_AVAILABLE = False
+    print("sentence-transformers not installed - Chroma will embed chunks itself")
+
+embedding_seconds = registry.histogram("embedding_batch_seconds", "Time to embed one batch of chunks")
+embedded_chunks = registry.counter("embedding_chunks_total", "Chunks embedded by the local embedding engine")
+
+_model = None
+_model_lock = threading.Lock()
+
+def _get_model():
+    """Load the model once per process"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBEDDING_MODEL, device=EMBEDDING_DEVICE)
+        return _model
+
+def _encode_sorted(texts: list[str], batch_size: int) -> list[list[float]]:
+    """Encode in batches of similar length so little compute goes to padding"""
+    model = _get_model()
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        encoded = model.encode([texts[i] for i in batch], batch_size=len(batch), show_progress_bar=False)
+        for i, vector in zip(batch, encoded):
+            vectors[i] = vector.tolist()
+    return vectors
+
+def _init_worker(threads: int):
+    # Split the CPU cores between workers instead of each one using all of them
+    import torch
+    torch.set_num_threads(threads)
+    _get_model()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // EMBEDDING_WORKERS)
+            _pool = ProcessPoolExecutor(max_workers=EMBEDDING_WORKERS, initializer=_init_worker, initargs=(threads,))
+        return _pool
+
+class EmbeddingStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def record(self, chunks: int, seconds: float):
+        with self.lock:
+            self.chunks += chunks
+            self.seconds += seconds
+        embedded_chunks.inc(chunks)
+        embedding_seconds.observe(seconds)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "model": EMBEDDING_MODEL,
+                "available": EMBEDDINGS_AVAILABLE,
+                "workers": EMBEDDING_WORKERS,
+                "batch_size": EMBEDDING_BATCH_SIZE,
+                "chunks": self.chunks,
+                "seconds": round(self.seconds, 3),
+                "chunks_per_sec": self.chunks / self.seconds if self.seconds else None,
+                "cache": embedding_cache.stats() if embedding_cache is not None else None,
+            }
+
+embedding_stats = EmbeddingStats()
+
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL) if EMBEDDING_CACHE_ENABLED and EMBEDDINGS_AVAILABLE else None
+
+def embed_texts(texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE, use_cache: bool = True):
+    """Embed texts with the local model, in input order.
+
+    Chunks already in the embedding cache are not sent to the model. Returns
+    None when sentence-transformers is not installed so callers can let
+    Chroma embed instead.
+    """
+    if not EMBEDDINGS_AVAILABLE:
+        return None
+    if not texts:
+        return []
+
+    if use_cache and embedding_cache is not None:
+        hashes = [chunk_hash(text) for text in texts]
+        vectors = embedding_cache.get_many(hashes)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = _embed_uncached([texts[i] for i in missing], batch_size)
+            embedding_cache.set_many([hashes[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+    return _embed_uncached(texts, batch_size)
+
+def _embed_uncached(texts: list[str], batch_size: int) -> list[list[float]]:
+    started = time.monotonic()
+    if EMBEDDING_WORKERS > 0 and len(texts) > batch_size:
+        # Contiguous slices of the length-sorted order, one task per batch group
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        step = max(batch_size, -(-len(order) // EMBEDDING_WORKERS))
+        slices = [order[start:start + step] for start in range(0, len(order), step)]
+        futures = [_get_pool().submit(_encode_sorted, [texts[i] for i in part], batch_size) for part in slices]
+        vectors = [None] * len(texts)
+        for part, future in zip(slices, futures):
+            for i, vector in zip(part, future.result()):
+                vectors[i] = vector
+    else:
+        vectors = _encode_sorted(texts, batch_size)
+    embedding_stats.record(len(texts), time.monotonic() - started)
+    return vectors
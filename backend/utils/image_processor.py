@@ -0,0 +1,50 @@
+import hashlib
+import io
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    print("Pillow not installed - vision images are sent unprocessed")
+
+# Longest side sent to the vision model; larger images add bytes, not detail
+VISION_MAX_DIMENSION = int(os.getenv("VISION_MAX_DIMENSION", 1536))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", 85))
+
+def preprocess_image(data: bytes) -> bytes:
+    """Downscale, re-encode as JPEG and strip metadata (EXIF, GPS, ...) from an uploaded image.
+
+    Raises ValueError if the data is not a readable image. Without Pillow
+    the bytes are returned unchanged.
+    """
+    if Image is None:
+        return data
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Apply the EXIF orientation before the metadata is dropped
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                # JPEG has no alpha - flatten onto white like most viewers show it
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            image.thumbnail((VISION_MAX_DIMENSION, VISION_MAX_DIMENSION), Image.LANCZOS)
+
+            output = io.BytesIO()
+            # No exif= argument, so no metadata is written
+            image.save(output, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+            return output.getvalue()
+    except Exception as e:
+        raise ValueError(f"Unsupported image: {str(e)}")
+
+def image_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
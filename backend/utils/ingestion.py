@@ -0,0 +1,374 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models.paper import Paper, PaperContent, IngestionJob
+from utils.pdf_processor import (
+    cache_document_text, read_text_sample, stream_pdf_chunks,
+    summarize_sections, enrich_paper, extract_category_and_tags, categorize_papers
+)
+from utils.metrics import ingestion_stage_seconds
+from utils.vectordb import add_paper_chunks_in_batches, delete_paper_from_vectordb
+from utils.content_registry import (
+    save_upload_with_hash, get_registered_content, register_content, create_paper_from_content
+)
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+INGESTION_STAGES = ["extract", "metadata", "summarize", "embed"]
+RECATEGORIZE_STAGES = ["categorize"]
+# Running jobs are owned by one process, which refreshes their heartbeat. A
+# job whose heartbeat is older than INGESTION_STALE_SECONDS lost its owner.
+INGESTION_HEARTBEAT_SECONDS = int(os.getenv("INGESTION_HEARTBEAT_SECONDS", 15))
+INGESTION_STALE_SECONDS = int(os.getenv("INGESTION_STALE_SECONDS", 60))
+
+def worker_id() -> str:
+    """Owner tag for jobs run by this process (computed per call - workers may be forked)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def create_job(db: Session, user_id: int, file_path: str, file_name: str, content_hash: str) -> IngestionJob:
+    """Persist a new queued ingestion job"""
+    job = IngestionJob(
+        user_id=user_id,
+        status="queued",
+        stage_state=json.dumps({stage: "pending" for stage in INGESTION_STAGES}),
+        file_path=file_path,
+        file_name=file_name,
+        content_hash=content_hash
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def create_recategorize_job(db: Session, user_id: int) -> IngestionJob:
+    """Persist a queued job that re-tags the user's whole library"""
+    job = IngestionJob(
+        user_id=user_id,
+        kind="recategorize",
+        status="queued",
+        stage_state=json.dumps({stage: "pending" for stage in RECATEGORIZE_STAGES})
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def complete_job(db: Session, job: IngestionJob, paper_id: int):
+    """Mark a job as finished, e.g. when its content was already processed"""
+    job.status = "completed"
+    job.stage = None
+    job.stage_state = json.dumps({stage: "done" for stage in INGESTION_STAGES})
+    job.paper_id = paper_id
+    db.commit()
+    db.refresh(job)
+    return job
+
+def complete_job_from_content(db: Session, job: IngestionJob, content: PaperContent) -> IngestionJob:
+    """Finish an upload job by reusing already processed content.
+
+    On failure the job is marked failed (so it is not re-ingested after a
+    restart) and the uploaded file removed before the error is re-raised.
+    """
+    try:
+        paper = create_paper_from_content(db, content, job.user_id, job.file_path, job.file_name)
+    except Exception as e:
+        db.rollback()
+        job.status = "failed"
+        job.error = str(e)
+        db.commit()
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        raise
+    return complete_job(db, job, paper.id)
+
+def _set_stage(db: Session, job: IngestionJob, stage: str, state: str):
+    stages = job.stages
+    stages[stage] = state
+    job.stage_state = json.dumps(stages)
+    job.stage = stage if state == "running" else job.stage
+    db.commit()
+
+def ingest_paper(
+    db: Session, user_id: int, file_path: str, file_name: str, content_hash: str,
+    title: str = None, on_stage=None
+) -> Paper:
+    """Run the full extract -> metadata -> summarize -> embed pipeline for one PDF.
+
+    title overrides the LLM-extracted title.
+    on_stage(stage, state) is called as each stage starts and finishes.
+    On failure the uploaded file and any partially stored paper are removed.
+    """
+    report_stage = on_stage or (lambda stage, state: None)
+    stage_started = {}
+
+    def on_stage(stage, state):
+        # Stage timings show whether extraction, the LLM or embedding is slow
+        if state == "running":
+            stage_started[stage] = time.monotonic()
+        elif stage in stage_started:
+            ingestion_stage_seconds.observe(time.monotonic() - stage_started.pop(stage), stage=stage)
+        report_stage(stage, state)
+
+    paper = None
+    try:
+        # Extract every page once; all later stages read from the text cache
+        on_stage("extract", "running")
+        cache_document_text(file_path, content_hash)
+        text = read_text_sample(file_path, content_hash=content_hash)
+        on_stage("extract", "done")
+
+        # Long papers: summarize their sections in parallel (map step)
+        on_stage("summarize", "running")
+        section_summaries = summarize_sections(file_path, content_hash=content_hash)
+        on_stage("summarize", "done")
+        
+        # One fused LLM call produces metadata, summary, category and tags,
+        # reducing the section summaries into the paper summary
+        on_stage("metadata", "running")
+        enrichment = enrich_paper(text, section_summaries=section_summaries)
+        on_stage("metadata", "done")
+
+        on_stage("embed", "running")
+        paper = Paper(
+            user_id=user_id,
+            title=title or enrichment['title'],
+            authors=enrichment['authors'],
+            file_path=file_path,
+            file_name=file_name,
+            summary=enrichment['summary'],
+            category=enrichment['category'],
+            tags=enrichment['tags'],
+            content_hash=content_hash
+        )
+        db.add(paper)
+        db.commit()
+        db.refresh(paper)
+
+        # Stream pages -> chunks -> vector database in fixed-size batches
+        add_paper_chunks_in_batches(user_id, paper.id, stream_pdf_chunks(file_path, content_hash=content_hash))
+        register_content(db, content_hash, paper, text, title=enrichment['title'])
+        on_stage("embed", "done")
+
+        return paper
+    except Exception:
+        db.rollback()
+        if paper is not None and paper.id:
+            delete_paper_from_vectordb(user_id, paper.id)
+            db.delete(paper)
+            db.commit()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+def ingest_batch_file(user_id: int, source, file_path: str, file_name: str, title: str):
+    """Save, deduplicate and fully process one file of a batch upload.
+
+    Blocking and self-contained (own DB session) so several files can run
+    concurrently in the threadpool. Returns (paper_id, reused).
+    """
+    db = SessionLocal()
+    try:
+        content_hash = save_upload_with_hash(source, file_path)
+
+        content = get_registered_content(db, content_hash)
+        if content:
+            try:
+                if content.category is None:
+                    # Registered before /upload produced categories
+                    cat_tags = extract_category_and_tags(content.text_sample or "", content.summary or "")
+                    content.category = cat_tags['category']
+                    content.tags = cat_tags['tags']
+                    db.commit()
+                paper = create_paper_from_content(db, content, user_id, file_path, file_name, title=title)
+            except Exception:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                raise
+            return paper.id, True
+
+        paper = ingest_paper(db, user_id, file_path, file_name, content_hash, title=title)
+        return paper.id, False
+    finally:
+        db.close()
+
+def recategorize_library(db: Session, user_id: int) -> int:
+    """Re-assign category and tags of every summarized paper of a user with batched LLM calls.
+
+    Registered content is updated too, so later duplicate uploads get the
+    new tags. Returns the number of papers updated.
+    """
+    papers = db.query(Paper).filter(Paper.user_id == user_id, Paper.summary.isnot(None)).all()
+    if not papers:
+        return 0
+
+    results = categorize_papers([paper.summary for paper in papers])
+    hashes = [paper.content_hash for paper in papers if paper.content_hash]
+    contents = {
+        content.content_hash: content
+        for content in db.query(PaperContent).filter(PaperContent.content_hash.in_(hashes)).all()
+    } if hashes else {}
+
+    for paper, result in zip(papers, results):
+        paper.category = result['category']
+        paper.tags = result['tags']
+        content = contents.get(paper.content_hash)
+        if content is not None:
+            content.category = result['category']
+            content.tags = result['tags']
+    db.commit()
+    return len(papers)
+
+def _run_recategorize_job(db: Session, job: IngestionJob):
+    try:
+        _set_stage(db, job, "categorize", "running")
+        recategorize_library(db, job.user_id)
+        _set_stage(db, job, "categorize", "done")
+    except Exception as e:
+        db.rollback()
+        _set_stage(db, job, "categorize", "failed")
+        job.status = "failed"
+        job.error = str(e)
+        db.commit()
+        print(f"Recategorize job {job.id} failed: {str(e)}")
+        return
+
+    job.status = "completed"
+    job.stage = None
+    db.commit()
+
+def run_job(job_id: int):
+    """Process one queued job to completion (blocking - runs in a worker thread)"""
+    db = SessionLocal()
+    try:
+        # Claim atomically so a job is never run twice
+        claimed = db.query(IngestionJob).filter(
+            IngestionJob.id == job_id,
+            IngestionJob.status == "queued"
+        ).update({"status": "running", "worker_id": worker_id(), "heartbeat_at": time.time()})
+        db.commit()
+        if not claimed:
+            return
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        if job.kind == "recategorize":
+            _run_recategorize_job(db, job)
+            return
+
+        current = {}
+
+        def on_stage(stage, state):
+            current["stage"] = stage
+            _set_stage(db, job, stage, state)
+
+        try:
+            paper = ingest_paper(db, job.user_id, job.file_path, job.file_name, job.content_hash, on_stage=on_stage)
+        except Exception as e:
+            db.rollback()
+            if current.get("stage"):
+                _set_stage(db, job, current["stage"], "failed")
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+            print(f"Ingestion job {job_id} failed: {str(e)}")
+            return
+
+        job.status = "completed"
+        job.stage = None
+        job.paper_id = paper.id
+        db.commit()
+    finally:
+        db.close()
+
+def _fail_orphaned_jobs(db: Session):
+    """Fail running jobs whose owner stopped heartbeating (crashed or restarted process)"""
+    cutoff = time.time() - INGESTION_STALE_SECONDS
+    orphaned = db.query(IngestionJob).filter(
+        IngestionJob.status == "running",
+        (IngestionJob.heartbeat_at == None) | (IngestionJob.heartbeat_at < cutoff)  # noqa: E711
+    ).all()
+    for job in orphaned:
+        job.status = "failed"
+        job.error = f"Interrupted: worker {job.worker_id or 'unknown'} stopped"
+    db.commit()
+
+def _beat():
+    """Refresh this process's running jobs and reclaim ones abandoned by other processes"""
+    db = SessionLocal()
+    try:
+        db.query(IngestionJob).filter(
+            IngestionJob.status == "running",
+            IngestionJob.worker_id == worker_id()
+        ).update({"heartbeat_at": time.time()})
+        db.commit()
+        _fail_orphaned_jobs(db)
+    finally:
+        db.close()
+
+class IngestionQueue:
+    """In-process job queue drained by a fixed number of worker tasks.
+
+    Jobs are persisted in the ingestion_jobs table; the queue only carries IDs.
+    The blocking pipeline runs in threads so the event loop stays responsive.
+    """
+
+    def __init__(self, workers: int = INGESTION_WORKERS):
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+
+    async def start(self, recover: bool = True):
+        if self.tasks:
+            return
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._heartbeat()))
+        if recover:
+            await asyncio.to_thread(self._recover_jobs)
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def enqueue(self, job_id: int):
+        if not self.tasks:
+            await self.start(recover=False)
+        await self.queue.put(job_id)
+
+    def _recover_jobs(self):
+        """Requeue jobs left queued by a previous process; fail running jobs whose owner is gone.
+
+        Jobs still heartbeating belong to a live worker process and are left
+        alone. Claiming is atomic, so a queued job picked up twice runs once.
+        """
+        db = SessionLocal()
+        try:
+            _fail_orphaned_jobs(db)
+            queued = db.query(IngestionJob.id).filter(IngestionJob.status == "queued").order_by(IngestionJob.id).all()
+        finally:
+            db.close()
+        for (job_id,) in queued:
+            self.queue.put_nowait(job_id)
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                await asyncio.to_thread(_beat)
+            except Exception as e:
+                print(f"Ingestion heartbeat failed: {str(e)}")
+            await asyncio.sleep(INGESTION_HEARTBEAT_SECONDS)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await asyncio.to_thread(run_job, job_id)
+            except Exception as e:
+                print(f"Ingestion worker error on job {job_id}: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+ingestion_queue = IngestionQueue()
@@ -1,39 +1,300 @@
 <<<<<<< HEAD
-from groq import Groq
+from groq import Groq, AsyncGroq
+import asyncio
+import httpx
+import importlib.util
 import os
+import time
 from dotenv import load_dotenv
+from utils.llm_cache import response_cache, make_cache_key, is_cacheable, CACHE_TTLS
+from utils.singleflight import SingleFlight, AsyncSingleFlight
+from utils.llm_scheduler import llm_scheduler, priority_for
+from utils.token_budget import count_message_tokens, route_budget, fit_text, token_usage
+from utils.model_router import route_for, route_stats
+from utils.semantic_cache import semantic_cache
+from utils.metrics import llm_request_seconds, llm_tokens, llm_errors
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# HTTP connection pool shared by every LLM call in the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+# HTTP/2 multiplexing needs the optional `h2` package
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+# Point at a Groq-compatible server instead, e.g. mock_groq_server.py for offline load tests
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
 
-def chat_with_llm(messages: list, model: str = "llama-3.3-70b-versatile", temperature: float = 0.7):
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+# Retries are left to llm_scheduler, which knows the rate limits and priorities
+# Sync client for scripts and code running in worker threads
+client = Groq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    base_url=GROQ_BASE_URL,
+    max_retries=0,
+    http_client=httpx.Client(http2=LLM_HTTP2, limits=_http_limits(), timeout=LLM_TIMEOUT)
+)
+
+# Async client awaited directly by the routers
+async_client = AsyncGroq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    base_url=GROQ_BASE_URL,
+    max_retries=0,
+    http_client=httpx.AsyncClient(http2=LLM_HTTP2, limits=_http_limits(), timeout=LLM_TIMEOUT)
+)
+
+# Identical requests already in flight are joined instead of sent again
+llm_flights = SingleFlight()
+async_llm_flights = AsyncSingleFlight()
+
+def _prepare_request(messages: list, model: str, temperature: float, max_tokens: int, call_site: str, response_format: dict):
+    """Build the completion params, the request key and whether the response may be cached"""
+    params = {"max_tokens": max_tokens}
+    if response_format:
+        params["response_format"] = response_format
+    
+    request_key = make_cache_key(model, temperature, messages, **params)
+    cacheable = is_cacheable(call_site, temperature)
+    if not cacheable:
+        response_cache.record_bypass(call_site)
+    return params, request_key, cacheable
+
+def _schedule_args(messages: list, max_tokens: int, call_site: str, model: str) -> dict:
+    """Priority class, token reservation and model budget for llm_scheduler"""
+    return {"priority": priority_for(call_site), "est_tokens": count_message_tokens(messages) + max_tokens, "model": model}
+
+def _record_outcome(call_site: str, model: str, started: float, ok: bool = True, fallback: bool = False):
+    """Feed one finished Groq request into the route stats and latency metrics"""
+    seconds = time.monotonic() - started
+    route_stats.record(call_site, model, seconds, ok=ok, fallback=fallback)
+    llm_request_seconds.observe(seconds, call_site=call_site, model=model, outcome="ok" if ok else "error")
+    if not ok:
+        llm_errors.inc(call_site=call_site, model=model)
+
+def _record_usage(call_site: str, model: str, messages: list, usage):
+    token_usage.record_call(call_site, model, count_message_tokens(messages), usage)
+    if usage is not None:
+        llm_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, call_site=call_site, model=model, kind="prompt")
+        llm_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, call_site=call_site, model=model, kind="completion")
+
+def _complete(messages: list, model: str, temperature: float, params: dict, call_site: str, fallback: bool = False) -> str:
+    """One scheduled completion on the sync client, timed for the route stats"""
+    started = time.monotonic()
+    try:
+        chat_completion = llm_scheduler.run(
+            lambda: client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                **params
+            ),
+            **_schedule_args(messages, params["max_tokens"], call_site, model)
+        )
+    except Exception:
+        _record_outcome(call_site, model, started, ok=False, fallback=fallback)
+        raise
+    _record_outcome(call_site, model, started, fallback=fallback)
+    _record_usage(call_site, model, messages, chat_completion.usage)
+    return chat_completion.choices[0].message.content
+
+async def _complete_async(messages: list, model: str, temperature: float, params: dict, call_site: str, fallback: bool = False) -> str:
+    """Async version of _complete"""
+    started = time.monotonic()
+    try:
+        chat_completion = await llm_scheduler.run_async(
+            lambda: async_client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                **params
+            ),
+            **_schedule_args(messages, params["max_tokens"], call_site, model)
+        )
+    except Exception:
+        _record_outcome(call_site, model, started, ok=False, fallback=fallback)
+        raise
+    _record_outcome(call_site, model, started, fallback=fallback)
+    _record_usage(call_site, model, messages, chat_completion.usage)
+    return chat_completion.choices[0].message.content
+
+def _fallback_model(call_site: str, model: str):
+    """The route's fallback, if model is the route's primary model"""
+    route = route_for(call_site)
+    if model == route["model"] and route["fallback"] and route["fallback"] != model:
+        return route["fallback"]
+    return None
+
+def chat_with_llm(
+    messages: list,
+    model: str = None,
+    temperature: float = 0.7,
+    max_tokens: int = None,
+    call_site: str = "chat",
+    response_format: dict = None
+):
     """
     Send messages to Groq LLM and get response.
     
     Args:
         messages: List of message dicts with 'role' and 'content'
-        model: Groq model name
+        model: Groq model name, defaults to the route for call_site
         temperature: Response randomness (0-1)
+        max_tokens: Maximum tokens to generate, defaults to the route's
+        call_site: Name of the calling feature, selects the model route and cache policy
+        response_format: Optional Groq response_format (e.g. JSON mode)
     
     Returns:
         str: LLM response content
     """
-    try:
-        chat_completion = client.chat.completions.create(
+    model = model or route_for(call_site)["model"]
+    max_tokens = max_tokens or route_for(call_site)["max_tokens"]
+    params, request_key, cacheable = _prepare_request(messages, model, temperature, max_tokens, call_site, response_format)
+    if cacheable:
+        cached = response_cache.get(request_key, call_site)
+        if cached is not None:
+            return cached
+    
+    def call():
+        try:
+            content = _complete(messages, model, temperature, params, call_site)
+        except Exception as e:
+            fallback = _fallback_model(call_site, model)
+            if not fallback:
+                raise Exception(f"Groq API Error: {str(e)}")
+            print(f"{call_site}: {model} failed, falling back to {fallback}: {str(e)}")
+            try:
+                content = _complete(messages, fallback, temperature, params, call_site, fallback=True)
+            except Exception as e:
+                raise Exception(f"Groq API Error: {str(e)}")
+        
+        if cacheable:
+            response_cache.set(request_key, content, CACHE_TTLS[call_site])
+        return content
+    
+    return llm_flights.do(request_key, call)
+
+async def chat_with_llm_async(
+    messages: list,
+    model: str = None,
+    temperature: float = 0.7,
+    max_tokens: int = None,
+    call_site: str = "chat",
+    response_format: dict = None
+):
+    """
+    Async version of chat_with_llm on the shared pooled AsyncGroq client.
+    Does not tie up a threadpool thread while waiting for Groq.
+    """
+    model = model or route_for(call_site)["model"]
+    max_tokens = max_tokens or route_for(call_site)["max_tokens"]
+    params, request_key, cacheable = _prepare_request(messages, model, temperature, max_tokens, call_site, response_format)
+    if cacheable:
+        cached = await response_cache.get_async(request_key, call_site)
+        if cached is not None:
+            return cached
+    
+    async def call():
+        try:
+            content = await _complete_async(messages, model, temperature, params, call_site)
+        except Exception as e:
+            fallback = _fallback_model(call_site, model)
+            if not fallback:
+                raise Exception(f"Groq API Error: {str(e)}")
+            print(f"{call_site}: {model} failed, falling back to {fallback}: {str(e)}")
+            try:
+                content = await _complete_async(messages, fallback, temperature, params, call_site, fallback=True)
+            except Exception as e:
+                raise Exception(f"Groq API Error: {str(e)}")
+        
+        if cacheable:
+            await response_cache.set_async(request_key, content, CACHE_TTLS[call_site])
+        return content
+    
+    return await async_llm_flights.do(request_key, call)
+
+async def _open_stream(messages: list, model: str, temperature: float, params: dict, call_site: str):
+    # Only opening the stream is scheduled; usage is not reported mid-stream
+    return await llm_scheduler.run_async(
+        lambda: async_client.chat.completions.create(
             messages=messages,
             model=model,
             temperature=temperature,
-            max_tokens=2048,
-        )
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        raise Exception(f"Groq API Error: {str(e)}")
+            stream=True,
+            **params
+        ),
+        **_schedule_args(messages, params["max_tokens"], call_site, model)
+    )
 
-def analyze_research_trends(query: str):
+async def stream_chat_with_llm(
+    messages: list,
+    model: str = None,
+    temperature: float = 0.7,
+    max_tokens: int = None,
+    call_site: str = "chat"
+):
     """
-    Specialized agent for analyzing research trends.
+    Stream the response as text deltas while Groq generates it.
+    
+    Closing the generator early (e.g. the client went away) closes the
+    upstream HTTP stream so Groq stops generating.
     """
+    model = model or route_for(call_site)["model"]
+    max_tokens = max_tokens or route_for(call_site)["max_tokens"]
+    params, request_key, cacheable = _prepare_request(messages, model, temperature, max_tokens, call_site, None)
+    if cacheable:
+        cached = await response_cache.get_async(request_key, call_site)
+        if cached is not None:
+            yield cached
+            return
+    
+    started = time.monotonic()
+    used_fallback = False
+    try:
+        stream = await _open_stream(messages, model, temperature, params, call_site)
+    except Exception as e:
+        _record_outcome(call_site, model, started, ok=False)
+        fallback = _fallback_model(call_site, model)
+        if not fallback:
+            raise Exception(f"Groq API Error: {str(e)}")
+        print(f"{call_site}: {model} failed, falling back to {fallback}: {str(e)}")
+        model, used_fallback, started = fallback, True, time.monotonic()
+        try:
+            stream = await _open_stream(messages, model, temperature, params, call_site)
+        except Exception as e:
+            _record_outcome(call_site, model, started, ok=False, fallback=True)
+            raise Exception(f"Groq API Error: {str(e)}")
+    
+    parts = []
+    completed = False
+    usage = None
+    try:
+        async for chunk in stream:
+            # Groq reports usage on the final chunk
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+        completed = True
+    except Exception as e:
+        _record_outcome(call_site, model, started, ok=False, fallback=used_fallback)
+        raise Exception(f"Groq API Error: {str(e)}")
+    finally:
+        await stream.close()
+    
+    _record_outcome(call_site, model, started, fallback=used_fallback)
+    _record_usage(call_site, model, messages, usage)
+    if completed and cacheable:
+        await response_cache.set_async(request_key, "".join(parts), CACHE_TTLS[call_site])
+
+def _trends_messages(query: str) -> list:
     system_prompt = """You are a Research Trend Analyzer AI. Your role is to:
     1. Identify emerging research topics and methodologies
     2. Analyze publication patterns and citation trends
@@ -42,17 +303,22 @@ def analyze_research_trends(query: str):
     
     Be concise, data-driven, and actionable."""
     
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": query}
     ]
-    
-    return chat_with_llm(messages, temperature=0.5)
 
-def research_assistant(query: str, context: str = ""):
+def analyze_research_trends(query: str):
     """
-    General research assistant for answering questions.
+    Specialized agent for analyzing research trends.
     """
+    return chat_with_llm(_trends_messages(query), temperature=0.5, call_site="trends")
+
+async def analyze_research_trends_async(query: str):
+    """Async version of analyze_research_trends"""
+    return await chat_with_llm_async(_trends_messages(query), temperature=0.5, call_site="trends")
+
+def _research_messages(query: str, context: str) -> list:
     system_prompt = """You are ResearchHub AI, an intelligent research assistant. You help researchers by:
     - Answering questions about research methodologies
     - Explaining complex concepts
@@ -62,20 +328,78 @@ def research_assistant(query: str, context: str = ""):
     Be helpful, accurate, and cite sources when possible."""
     
     messages = [
-        {"role": "system", "content": system_prompt}
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
     ]
     
     if context:
-        messages.append({"role": "system", "content": f"Context: {context}"})
+        # Chat history is oldest-first, so the oldest part is dropped first
+        budget = route_budget("chat", messages + [{"role": "system", "content": "Context: "}])
+        context = fit_text(context, budget, call_site="chat", keep="end")
+        messages.insert(1, {"role": "system", "content": f"Context: {context}"})
     
-    messages.append({"role": "user", "content": query})
-    
-    return chat_with_llm(messages)
+    return messages
+
+def _semantic_lookup(query: str, context: str, user_id: int):
+    if semantic_cache is None:
+        return None
+    try:
+        return semantic_cache.get(query, context=context, user_id=user_id)
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {str(e)}")
+        return None
+
+def _semantic_store(query: str, answer: str, context: str, user_id: int):
+    if semantic_cache is None or not answer:
+        return
+    try:
+        semantic_cache.set(query, answer, context=context, user_id=user_id)
+    except Exception as e:
+        print(f"Semantic cache store failed: {str(e)}")
 
-def vision_assistant(query: str, image_base64: str, context: str = ""):
+def research_assistant(query: str, context: str = "", user_id: int = None):
     """
-    Multimodal assistant for analyzing images.
+    General research assistant for answering questions.
+    Paraphrases of an already answered question are served from the semantic cache.
     """
+    cached = _semantic_lookup(query, context, user_id)
+    if cached is not None:
+        return cached
+    
+    answer = chat_with_llm(_research_messages(query, context))
+    _semantic_store(query, answer, context, user_id)
+    return answer
+
+async def research_assistant_async(query: str, context: str = "", user_id: int = None):
+    """Async version of research_assistant"""
+    cached = await asyncio.to_thread(_semantic_lookup, query, context, user_id)
+    if cached is not None:
+        return cached
+    
+    answer = await chat_with_llm_async(_research_messages(query, context))
+    await asyncio.to_thread(_semantic_store, query, answer, context, user_id)
+    return answer
+
+async def research_assistant_stream(query: str, context: str = "", user_id: int = None):
+    """Streaming version of research_assistant - async generator of text deltas"""
+    cached = await asyncio.to_thread(_semantic_lookup, query, context, user_id)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts = []
+    tokens = stream_chat_with_llm(_research_messages(query, context))
+    try:
+        async for delta in tokens:
+            parts.append(delta)
+            yield delta
+    finally:
+        await tokens.aclose()
+    
+    # Only complete answers are cached
+    await asyncio.to_thread(_semantic_store, query, "".join(parts), context, user_id)
+
+def _vision_messages(query: str, image_base64: str, context: str) -> list:
     system_prompt = """You are a Research Vision AI. You analyze research data, charts, 
     and diagrams provided in images. Provide detailed technical descriptions and insights 
     based on the visual evidence."""
@@ -93,15 +417,77 @@ def vision_assistant(query: str, image_base64: str, context: str = ""):
     })
     
     messages = [
-        {"role": "system", "content": system_prompt}
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": content}
     ]
     
     if context:
-        messages.append({"role": "system", "content": f"Context: {context}"})
-        
-    messages.append({"role": "user", "content": content})
+        budget = route_budget("vision", messages + [{"role": "system", "content": "Context: "}])
+        context = fit_text(context, budget, call_site="vision", keep="end")
+        messages.insert(1, {"role": "system", "content": f"Context: {context}"})
+    
+    return messages
+
+def _vision_answer_key(query: str, image_hash: str):
+    """Answers are reused per (image, question).
+
+    The chat context is left out on purpose: it changes with every turn, so
+    keying on it would mean the same question about the same image in an
+    ongoing chat never hits.
+    """
+    if not image_hash:
+        return None
+    return make_cache_key(route_for("vision")["model"], 0, [], image_hash=image_hash, query=(query or "").strip())
+
+def vision_assistant(query: str, image_base64: str, context: str = "", image_hash: str = None):
+    """
+    Multimodal assistant for analyzing images.
+    image_hash (of the preprocessed image) enables the answer cache.
+    """
+    key = _vision_answer_key(query, image_hash)
+    if key:
+        cached = response_cache.get(key, "vision_answer")
+        if cached is not None:
+            return cached
+    
+    answer = chat_with_llm(_vision_messages(query, image_base64, context), call_site="vision")
+    if key:
+        response_cache.set(key, answer, CACHE_TTLS["vision"])
+    return answer
+
+async def vision_assistant_async(query: str, image_base64: str, context: str = "", image_hash: str = None):
+    """Async version of vision_assistant"""
+    key = _vision_answer_key(query, image_hash)
+    if key:
+        cached = await response_cache.get_async(key, "vision_answer")
+        if cached is not None:
+            return cached
+    
+    answer = await chat_with_llm_async(_vision_messages(query, image_base64, context), call_site="vision")
+    if key:
+        await response_cache.set_async(key, answer, CACHE_TTLS["vision"])
+    return answer
+
+async def vision_assistant_stream(query: str, image_base64: str, context: str = "", image_hash: str = None):
+    """Streaming version of vision_assistant - async generator of text deltas"""
+    key = _vision_answer_key(query, image_hash)
+    if key:
+        cached = await response_cache.get_async(key, "vision_answer")
+        if cached is not None:
+            yield cached
+            return
+    
+    parts = []
+    tokens = stream_chat_with_llm(_vision_messages(query, image_base64, context), call_site="vision")
+    try:
+        async for delta in tokens:
+            parts.append(delta)
+            yield delta
+    finally:
+        await tokens.aclose()
     
-    return chat_with_llm(messages, model="meta-llama/llama-4-scout-17b-16e-instruct")
+    if key:
+        await response_cache.set_async(key, "".join(parts), CACHE_TTLS["vision"])
 =======
 from groq import Groq
 import os
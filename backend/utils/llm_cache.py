@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+# Empty disables the on-disk tier
+LLM_CACHE_DISK_PATH = os.getenv("LLM_CACHE_DISK_PATH", "")
+# Rows kept in the on-disk tier; the ones expiring soonest are dropped first
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", 50000))
+# Expired and excess disk rows are purged every this many disk writes (and at startup)
+LLM_CACHE_PURGE_EVERY = int(os.getenv("LLM_CACHE_PURGE_EVERY", 500))
+
+# Seconds a response stays valid, per call site. 0 disables caching for that site.
+CACHE_TTLS = {
+    "chat": 3600,
+    "vision": 3600,
+    "trends": 6 * 3600,
+    "metadata": 30 * 86400,
+    "summarize": 30 * 86400,
+    "summarize_section": 30 * 86400,
+    "category": 30 * 86400,
+    "category_batch": 30 * 86400,
+    "enrich": 30 * 86400,
+    "theme": 7 * 86400,
+    "synthesis": 86400,
+    "synthesis_node": 7 * 86400,
+}
+
+# Sampled (temperature > 0) responses are only reused for sites listed here;
+# free-form chat should stay non-deterministic.
+CACHE_SAMPLED_SITES = {"trends", "metadata", "summarize", "summarize_section", "category", "category_batch", "enrich", "theme", "synthesis", "synthesis_node"}
+
+def make_cache_key(model: str, temperature: float, messages: list, **params) -> str:
+    """Canonical hash of everything that determines an LLM response"""
+    payload = {"model": model, "temperature": temperature, "messages": messages, **params}
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def is_cacheable(call_site: str, temperature: float) -> bool:
+    """Whether responses for this call site / temperature may be served from cache"""
+    if CACHE_TTLS.get(call_site, 0) <= 0:
+        return False
+    return temperature <= 0 or call_site in CACHE_SAMPLED_SITES
+
+class ResponseCache:
+    """Two-tier cache: in-memory LRU in front of an optional SQLite file.
+
+    The disk tier blocks - async code uses get_async / set_async, which only
+    leave the event loop when the disk is actually touched.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, disk_path: str = "",
+                 disk_max_entries: int = LLM_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.disk_writes = 0
+        self.memory = OrderedDict()  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0})
+        self.disk = None
+        if disk_path:
+            self.disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self.disk.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self.disk.commit()
+            self.purge_expired()
+
+    def _get_memory(self, key: str, call_site: str):
+        """Memory-tier lookup; counts hits only"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and entry[1] > time.time():
+                self.memory.move_to_end(key)
+                self.counters[call_site]["memory_hits"] += 1
+                return entry[0]
+            if entry:
+                del self.memory[key]
+            return None
+
+    def _get_disk(self, key: str, call_site: str):
+        """Disk-tier lookup after a memory miss (blocking); counts the hit or miss"""
+        with self.lock:
+            if self.disk is not None:
+                row = self.disk.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > time.time():
+                    self._remember(key, row[0], row[1])
+                    self.counters[call_site]["disk_hits"] += 1
+                    return row[0]
+
+            self.counters[call_site]["misses"] += 1
+            return None
+
+    def get(self, key: str, call_site: str = "default"):
+        value = self._get_memory(key, call_site)
+        if value is not None:
+            return value
+        return self._get_disk(key, call_site)
+
+    async def get_async(self, key: str, call_site: str = "default"):
+        value = self._get_memory(key, call_site)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return self._get_disk(key, call_site)
+        return await asyncio.to_thread(self._get_disk, key, call_site)
+
+    def _set_disk(self, key: str, value: str, expires_at: float):
+        with self.lock:
+            self.disk.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            self.disk.commit()
+            self.disk_writes += 1
+            purge = self.disk_writes % LLM_CACHE_PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def set(self, key: str, value: str, ttl: float):
+        expires_at = time.time() + ttl
+        with self.lock:
+            self._remember(key, value, expires_at)
+        if self.disk is not None:
+            self._set_disk(key, value, expires_at)
+
+    async def set_async(self, key: str, value: str, ttl: float):
+        expires_at = time.time() + ttl
+        with self.lock:
+            self._remember(key, value, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self._set_disk, key, value, expires_at)
+
+    def record_bypass(self, call_site: str):
+        with self.lock:
+            self.counters[call_site]["bypassed"] += 1
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self.memory[key] = (value, expires_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def purge_expired(self):
+        """Drop expired entries from both tiers and cap the disk tier at disk_max_entries rows"""
+        now = time.time()
+        with self.lock:
+            for key in [k for k, (_, expires_at) in self.memory.items() if expires_at <= now]:
+                del self.memory[key]
+            if self.disk is not None:
+                self.disk.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                excess = self.disk.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_max_entries
+                if excess > 0:
+                    self.disk.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires_at LIMIT ?)",
+                        (excess,)
+                    )
+                self.disk.commit()
+
+    def stats(self) -> dict:
+        with self.lock:
+            by_site = {site: dict(counts) for site, counts in self.counters.items()}
+            totals = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+            for counts in by_site.values():
+                for name, value in counts.items():
+                    totals[name] += value
+            lookups = totals["memory_hits"] + totals["disk_hits"] + totals["misses"]
+            return {
+                **totals,
+                "hit_rate": (totals["memory_hits"] + totals["disk_hits"]) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "disk_enabled": self.disk is not None,
+                "by_call_site": by_site,
+            }
+
+response_cache = ResponseCache(disk_path=LLM_CACHE_DISK_PATH)
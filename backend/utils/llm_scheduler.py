@@ -0,0 +1,267 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+from utils.metrics import llm_queue_wait_seconds, llm_retries
+from utils.model_router import limits_for
+
+load_dotenv()
+
+# Limits for models without an entry in model_router.MODEL_LIMITS
+GROQ_RPM_LIMIT = int(os.getenv("GROQ_RPM_LIMIT", 30))
+GROQ_TPM_LIMIT = int(os.getenv("GROQ_TPM_LIMIT", 12000))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 30.0))
+
+# Priority classes - lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Users wait on these call sites; everything else is bulk work
+INTERACTIVE_CALL_SITES = {"chat", "vision", "trends"}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+POLL_INTERVAL = 0.02
+
+def priority_for(call_site: str) -> int:
+    return INTERACTIVE if call_site in INTERACTIVE_CALL_SITES else BACKGROUND
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return True
+    # Connection errors / timeouts carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Honour Retry-After when Groq sends it, otherwise full-jitter exponential backoff"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), LLM_RETRY_MAX_DELAY) + random.uniform(0, LLM_RETRY_BASE_DELAY)
+    except ValueError:
+        pass
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most `per_minute` units"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+class ModelBudget:
+    """RPM/TPM buckets and the waiting queue of one model"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiting = []  # heap of (priority, seq)
+
+class LLMScheduler:
+    """Admits LLM requests in priority order within each model's RPM/TPM budget and retries failures.
+
+    Every model has its own budget and priority queue; only the head of a
+    queue may take budget, so interactive requests always go before queued
+    background ones for the same model, and a model out of budget never
+    holds up requests for another.
+    """
+
+    def __init__(self, rpm: int = GROQ_RPM_LIMIT, tpm: int = GROQ_TPM_LIMIT, max_retries: int = LLM_MAX_RETRIES):
+        self.default_limits = {"rpm": rpm, "tpm": tpm}
+        self.budgets = {}  # model -> ModelBudget
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.seq = itertools.count()
+        self.queued = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.admitted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.wait_seconds = {INTERACTIVE: 0.0, BACKGROUND: 0.0}
+        self.retries = 0
+        self.failures = 0
+
+    def _budget(self, model: str) -> ModelBudget:
+        """Budget of a model, created on first use (call with the lock held)"""
+        budget = self.budgets.get(model)
+        if budget is None:
+            limits = limits_for(model, self.default_limits)
+            budget = self.budgets[model] = ModelBudget(limits["rpm"], limits["tpm"])
+        return budget
+
+    def _enqueue(self, priority: int, model: str):
+        with self.lock:
+            ticket = (priority, next(self.seq))
+            heapq.heappush(self._budget(model).waiting, ticket)
+            self.queued[priority] += 1
+            return ticket
+
+    def _try_admit(self, ticket, est_tokens: int, model: str) -> float:
+        """Admit the ticket if it is at the head of its model's queue and budget allows; else return seconds to wait"""
+        with self.lock:
+            budget = self._budget(model)
+            if budget.waiting[0] != ticket:
+                return POLL_INTERVAL
+            now = time.monotonic()
+            budget.requests.refill(now)
+            budget.tokens.refill(now)
+            wait = max(budget.requests.wait_time(1), budget.tokens.wait_time(est_tokens))
+            if wait > 0:
+                return min(wait, 1.0)
+            heapq.heappop(budget.waiting)
+            budget.requests.consume(1)
+            budget.tokens.consume(est_tokens)
+            self.queued[ticket[0]] -= 1
+            self.admitted[ticket[0]] += 1
+            return 0.0
+
+    def _abandon(self, ticket, model: str):
+        with self.lock:
+            waiting = self._budget(model).waiting
+            if ticket in waiting:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                self.queued[ticket[0]] -= 1
+
+    def _record_wait(self, priority: int, seconds: float):
+        with self.lock:
+            self.wait_seconds[priority] += seconds
+        llm_queue_wait_seconds.observe(seconds, priority=PRIORITY_NAMES[priority])
+
+    def acquire(self, priority: int, est_tokens: int, model: str = None) -> float:
+        """Block until the request may be sent to model. Returns the time spent queued"""
+        ticket = self._enqueue(priority, model)
+        started = time.monotonic()
+        admitted = False
+        try:
+            while True:
+                wait = self._try_admit(ticket, est_tokens, model)
+                if wait == 0:
+                    admitted = True
+                    break
+                time.sleep(wait)
+        finally:
+            if not admitted:
+                self._abandon(ticket, model)
+        waited = time.monotonic() - started
+        self._record_wait(priority, waited)
+        return waited
+
+    async def acquire_async(self, priority: int, est_tokens: int, model: str = None) -> float:
+        """Async version of acquire - waits without blocking the event loop"""
+        ticket = self._enqueue(priority, model)
+        started = time.monotonic()
+        admitted = False
+        try:
+            while True:
+                wait = self._try_admit(ticket, est_tokens, model)
+                if wait == 0:
+                    admitted = True
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            if not admitted:
+                self._abandon(ticket, model)
+        waited = time.monotonic() - started
+        self._record_wait(priority, waited)
+        return waited
+
+    def record_usage(self, est_tokens: int, actual_tokens: int, model: str = None):
+        """Give back (or take) the difference between the reserved and the real token count"""
+        if actual_tokens is None:
+            return
+        with self.lock:
+            tokens = self._budget(model).tokens
+            tokens.level = min(tokens.capacity, tokens.level + est_tokens - actual_tokens)
+
+    def _record_retry(self, priority: int, error: Exception):
+        with self.lock:
+            self.retries += 1
+        llm_retries.inc(priority=PRIORITY_NAMES[priority], status=getattr(error, "status_code", None) or "connection")
+
+    def _record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def run(self, fn, priority: int, est_tokens: int, model: str = None):
+        """Call fn() once admitted for model, retrying 429/5xx/connection errors with jittered backoff"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, est_tokens, model)
+            try:
+                result = fn()
+            except Exception as e:
+                if attempt < self.max_retries and _is_retryable(e):
+                    self._record_retry(priority, e)
+                    time.sleep(_retry_delay(e, attempt))
+                    continue
+                self._record_failure()
+                raise
+            self.record_usage(est_tokens, _usage_tokens(result), model)
+            return result
+
+    async def run_async(self, coro_fn, priority: int, est_tokens: int, model: str = None):
+        """Async version of run - coro_fn is called again for every attempt"""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(priority, est_tokens, model)
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                if attempt < self.max_retries and _is_retryable(e):
+                    self._record_retry(priority, e)
+                    await asyncio.sleep(_retry_delay(e, attempt))
+                    continue
+                self._record_failure()
+                raise
+            self.record_usage(est_tokens, _usage_tokens(result), model)
+            return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            models = {}
+            for model, budget in self.budgets.items():
+                budget.requests.refill(now)
+                budget.tokens.refill(now)
+                models[model or "default"] = {
+                    "queue_depth": len(budget.waiting),
+                    "requests_available": round(budget.requests.level, 2),
+                    "tokens_available": round(budget.tokens.level, 2),
+                    "limits": {"rpm": int(budget.requests.capacity), "tpm": int(budget.tokens.capacity)},
+                }
+            return {
+                "queue_depth": {PRIORITY_NAMES[p]: n for p, n in self.queued.items()},
+                "admitted": {PRIORITY_NAMES[p]: n for p, n in self.admitted.items()},
+                "avg_wait_seconds": {
+                    PRIORITY_NAMES[p]: (self.wait_seconds[p] / self.admitted[p]) if self.admitted[p] else 0.0
+                    for p in self.admitted
+                },
+                "retries": self.retries,
+                "failures": self.failures,
+                "models": models,
+            }
+
+def _usage_tokens(result):
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+llm_scheduler = LLMScheduler()
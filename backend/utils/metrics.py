@@ -0,0 +1,134 @@
+import bisect
+import threading
+from collections import defaultdict
+
+# Minimal in-process metrics: labelled counters and histograms, rendered in
+# the Prometheus text format by GET /metrics.
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] += amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {_format_labels(key) or "total": value for key, value in self.values.items()}
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}  # label key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def _quantile(self, series: list, q: float):
+        """Bucket upper bound below which a fraction q of observations fall"""
+        total = sum(series[:-1])
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+            seen += count
+            if seen >= q * total:
+                return bound
+        return "+Inf"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            result = {}
+            for key, series in self.series.items():
+                count = sum(series[:-1])
+                result[_format_labels(key) or "total"] = {
+                    "count": count,
+                    "avg": series[-1] / count if count else None,
+                    "p50_le": self._quantile(series, 0.5),
+                    "p95_le": self._quantile(series, 0.95),
+                }
+            return result
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, description: str) -> Counter:
+        metric = Counter(name, description)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+registry = Registry()
+
+# LLM calls
+llm_request_seconds = registry.histogram(
+    "llm_request_seconds", "LLM call latency by call site, model and outcome, including scheduler wait and retries")
+llm_tokens = registry.counter("llm_tokens_total", "Tokens used by call site, model and kind (prompt / completion)")
+llm_errors = registry.counter("llm_errors_total", "Failed Groq requests by call site and model")
+llm_queue_wait_seconds = registry.histogram(
+    "llm_queue_wait_seconds", "Time requests waited in the LLM scheduler by priority", WAIT_BUCKETS)
+llm_retries = registry.counter("llm_retries_total", "Retried Groq requests by priority and status code")
+
+# PDF processing
+pdf_extract_seconds = registry.histogram("pdf_extract_seconds", "Time to extract all page text of a PDF with PyPDF2")
+pdf_pages = registry.counter("pdf_pages_total", "Pages extracted from PDFs")
+ingestion_stage_seconds = registry.histogram("ingestion_stage_seconds", "Time spent in each ingestion stage")
@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import defaultdict, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "llama-3.3-70b-versatile")
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "llama-3.1-8b-instant")
+VISION_MODEL = os.getenv("VISION_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+
+# Model per task (call site): extraction and short answers go to the small
+# model, long-form writing to the large one. The fallback is tried once when
+# the model still fails after the scheduler's retries. slo_ms is the latency
+# target the stats are checked against.
+MODEL_ROUTES = {
+    "metadata": {"model": LLM_SMALL_MODEL, "fallback": LLM_LARGE_MODEL, "max_tokens": 256, "slo_ms": 1500},
+    "category": {"model": LLM_SMALL_MODEL, "fallback": LLM_LARGE_MODEL, "max_tokens": 256, "slo_ms": 1500},
+    "category_batch": {"model": LLM_SMALL_MODEL, "fallback": LLM_LARGE_MODEL, "max_tokens": 2048, "slo_ms": 8000},
+    "theme": {"model": LLM_SMALL_MODEL, "fallback": LLM_LARGE_MODEL, "max_tokens": 50, "slo_ms": 1000},
+    "summarize_section": {"model": LLM_SMALL_MODEL, "fallback": LLM_LARGE_MODEL, "max_tokens": 256, "slo_ms": 3000},
+    "enrich": {"model": LLM_LARGE_MODEL, "fallback": LLM_SMALL_MODEL, "max_tokens": 1024, "slo_ms": 6000},
+    "summarize": {"model": LLM_LARGE_MODEL, "fallback": LLM_SMALL_MODEL, "max_tokens": 1024, "slo_ms": 6000},
+    "synthesis_node": {"model": LLM_LARGE_MODEL, "fallback": LLM_SMALL_MODEL, "max_tokens": 1024, "slo_ms": 8000},
+    "synthesis": {"model": LLM_LARGE_MODEL, "fallback": LLM_SMALL_MODEL, "max_tokens": 2048, "slo_ms": 15000},
+    "trends": {"model": LLM_LARGE_MODEL, "fallback": LLM_SMALL_MODEL, "max_tokens": 2048, "slo_ms": 8000},
+    "chat": {"model": LLM_LARGE_MODEL, "fallback": LLM_SMALL_MODEL, "max_tokens": 2048, "slo_ms": 8000},
+    "vision": {"model": VISION_MODEL, "fallback": None, "max_tokens": 2048, "slo_ms": 10000},
+}
+DEFAULT_ROUTE = {"model": LLM_LARGE_MODEL, "fallback": None, "max_tokens": 2048, "slo_ms": 8000}
+
+# Groq rate limits are per model, so each model gets its own request and
+# token budget in llm_scheduler - work routed to the small model does not eat
+# into the large model's quota.
+MODEL_LIMITS = {
+    LLM_LARGE_MODEL: {"rpm": int(os.getenv("LLM_LARGE_RPM", 30)), "tpm": int(os.getenv("LLM_LARGE_TPM", 12000))},
+    LLM_SMALL_MODEL: {"rpm": int(os.getenv("LLM_SMALL_RPM", 30)), "tpm": int(os.getenv("LLM_SMALL_TPM", 6000))},
+    VISION_MODEL: {"rpm": int(os.getenv("VISION_RPM", 30)), "tpm": int(os.getenv("VISION_TPM", 30000))},
+}
+
+def route_for(task: str) -> dict:
+    """Routing entry for a task, falling back to the large model"""
+    return MODEL_ROUTES.get(task, DEFAULT_ROUTE)
+
+def limits_for(model: str, default: dict) -> dict:
+    """RPM/TPM limits of a model, or default for models not in MODEL_LIMITS"""
+    return MODEL_LIMITS.get(model, default)
+
+class RouteStats:
+    """Latency and error counts per task and model, for tuning MODEL_ROUTES"""
+
+    def __init__(self, window: int = 500):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"calls": 0, "errors": 0, "fallbacks": 0, "slo_misses": 0})
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, task: str, model: str, seconds: float, ok: bool = True, fallback: bool = False):
+        with self.lock:
+            counters = self.counters[(task, model)]
+            counters["calls"] += 1
+            if not ok:
+                counters["errors"] += 1
+            if fallback:
+                counters["fallbacks"] += 1
+            if ok:
+                self.latencies[(task, model)].append(seconds)
+                if seconds * 1000 > route_for(task)["slo_ms"]:
+                    counters["slo_misses"] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            by_task = defaultdict(dict)
+            for (task, model), counters in self.counters.items():
+                latencies = sorted(self.latencies[(task, model)])
+                by_task[task][model] = {
+                    **counters,
+                    "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+                }
+            return {
+                "routes": MODEL_ROUTES,
+                "by_task": dict(by_task),
+            }
+
+route_stats = RouteStats()
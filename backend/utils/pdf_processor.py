@@ -1,43 +1,320 @@
 <<<<<<< HEAD
 from PyPDF2 import PdfReader
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from itertools import chain, islice
+import asyncio
+import hashlib
+import json
 import os
-from groq import Groq
+import re
+import threading
+import time
+import zlib
 from dotenv import load_dotenv
+from utils import text_cache
+from utils.metrics import pdf_extract_seconds, pdf_pages
+from utils.llm import chat_with_llm, chat_with_llm_async
+from utils.token_budget import route_budget, fit_text, pack_evenly, count_tokens
+from utils.model_router import route_for
 
 load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from PDF file"""
+# Parallel extraction config
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+
+# Map-reduce summarization config
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", 2000))
+# Documents up to this size are summarized in one call
+SUMMARY_SINGLE_PASS_TOKENS = int(os.getenv("SUMMARY_SINGLE_PASS_TOKENS", 2000))
+
+# Batched categorization: summary tokens per paper and output tokens reserved per paper
+CATEGORY_BATCH_SUMMARY_TOKENS = int(os.getenv("CATEGORY_BATCH_SUMMARY_TOKENS", 300))
+CATEGORY_BATCH_OUTPUT_TOKENS = 48
+
+# Tree-reduction synthesis: average number of summaries per node
+SYNTHESIS_FANOUT = int(os.getenv("SYNTHESIS_FANOUT", 8))
+
+# Shared by all callers, so it caps map-step LLM calls process-wide
+_summary_pool = ThreadPoolExecutor(max_workers=SUMMARY_MAP_CONCURRENCY)
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    """Lazily create the shared process pool used for page extraction"""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+        return _extract_pool
+
+def _extract_page_range(file_path: str, start: int, end: int) -> list[str]:
+    """Extract text of pages [start, end) - runs inside a worker process"""
+    reader = PdfReader(file_path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+def _split_page_ranges(num_pages: int, workers: int) -> list[tuple[int, int]]:
+    """Split pages into contiguous ranges, a few per worker to balance uneven pages"""
+    num_ranges = min(num_pages, workers * 4)
+    size, extra = divmod(num_pages, num_ranges)
+    ranges = []
+    start = 0
+    for i in range(num_ranges):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def iter_pdf_pages(file_path: str, workers: int = None):
+    """Yield the text of every page, in page order.
+
+    Documents shorter than PDF_PARALLEL_MIN_PAGES (or workers <= 1) are read
+    serially; longer ones are split into page ranges across a process pool,
+    keeping at most `workers` ranges in flight so memory stays bounded.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    pending = deque()
     try:
         reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        num_pages = len(reader.pages)
+
+        if workers <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+            return
+
+        pool = _get_extract_pool()
+        ranges = iter(_split_page_ranges(num_pages, workers))
+        for start, end in islice(ranges, workers):
+            pending.append(pool.submit(_extract_page_range, file_path, start, end))
+
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(pool.submit(_extract_page_range, file_path, *next_range))
+            yield from pages
     except Exception as e:
         raise Exception(f"PDF extraction error: {str(e)}")
+    finally:
+        # Consumer stopped early (or failed) - drop ranges nobody will read
+        for future in pending:
+            future.cancel()
+
+def _timed_pdf_pages(file_path: str, workers: int = None):
+    """iter_pdf_pages that records extraction time once every page was read"""
+    started = time.monotonic()
+    count = 0
+    for page in iter_pdf_pages(file_path, workers=workers):
+        count += 1
+        yield page
+    pdf_extract_seconds.observe(time.monotonic() - started)
+    pdf_pages.inc(count)
+
+def iter_document_pages(file_path: str, content_hash: str = None, workers: int = None):
+    """Yield raw page text, from the text cache when possible.
+
+    On a cache miss pages are extracted from the PDF and written through to
+    the cache; the entry is only committed if every page was consumed.
+    """
+    if not content_hash:
+        yield from _timed_pdf_pages(file_path, workers=workers)
+        return
+
+    try:
+        cached_pages = text_cache.iter_pages(content_hash)
+    except text_cache.CacheMiss:
+        pass
+    else:
+        yield from cached_pages
+        return
+
+    writer = text_cache.PageCacheWriter(content_hash)
+    completed = False
+    try:
+        for page in _timed_pdf_pages(file_path, workers=workers):
+            writer.add(page)
+            yield page
+        completed = True
+    finally:
+        if completed:
+            writer.commit()
+        else:
+            writer.abort()
+
+def cache_document_text(file_path: str, content_hash: str) -> int:
+    """Extract every page into the text cache (no-op if already cached). Returns the page count"""
+    count = 0
+    for _ in iter_document_pages(file_path, content_hash=content_hash):
+        count += 1
+    return count
+
+def extract_pages_from_pdf(file_path: str, content_hash: str = None, workers: int = None) -> list[str]:
+    """Extract text of every page, in page order"""
+    return list(iter_document_pages(file_path, content_hash=content_hash, workers=workers))
+
+def extract_text_from_pdf(file_path: str, content_hash: str = None, workers: int = None) -> str:
+    """Extract text from PDF file"""
+    pages = iter_document_pages(file_path, content_hash=content_hash, workers=workers)
+    return "".join(page + "\n" for page in pages)
+
+def normalize_page_text(text: str) -> str:
+    """Clean up raw extracted page text before chunking"""
+    text = text.replace("\x00", "")
+    text = re.sub(r"-\n(?=\w)", "", text)  # Re-join words hyphenated across lines
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip() + "\n"
+
+def iter_chunks(pages, chunk_size: int = 1000, overlap: int = 200):
+    """Incrementally split a stream of page texts into overlapping chunks.
+
+    Produces exactly the same chunks as chunk_text() on the concatenated
+    pages, but only ever holds one chunk plus the current page in memory.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    for page in pages:
+        buffer += page
+        while len(buffer) >= chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[step:]  # Carry the overlap into the next chunk
+
+    while buffer:
+        yield buffer[:chunk_size]
+        buffer = buffer[step:]
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[str]:
     """Split text into overlapping chunks"""
-    chunks = []
-    start = 0
-    text_length = len(text)
-    
-    while start < text_length:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
+    return list(iter_chunks([text], chunk_size=chunk_size, overlap=overlap))
+
+def stream_pdf_chunks(file_path: str, content_hash: str = None, chunk_size: int = 1000, overlap: int = 200):
+    """PDF pages -> normalized text -> overlapping chunks, one page at a time"""
+    pages = (normalize_page_text(page) for page in iter_document_pages(file_path, content_hash=content_hash))
+    return iter_chunks(pages, chunk_size=chunk_size, overlap=overlap)
+
+def read_text_sample(file_path: str, content_hash: str = None, max_chars: int = 16000) -> str:
+    """Read just enough leading pages for metadata extraction and summarization"""
+    pages = None
+    if content_hash:
+        try:
+            pages = text_cache.iter_pages(content_hash)
+        except text_cache.CacheMiss:
+            pass
+    if pages is None:
+        # Partial read - not worth populating the cache from
+        pages = iter_pdf_pages(file_path, workers=1)
+
+    sample = []
+    length = 0
+    for page in pages:
+        page = normalize_page_text(page)
+        sample.append(page)
+        length += len(page)
+        if length >= max_chars:
+            break
+    return "".join(sample)[:max_chars]
+
+def iter_document_sections(file_path: str, content_hash: str = None, target_tokens: int = SUMMARY_SECTION_TOKENS):
+    """Group a document's pages into sections of about target_tokens.
+
+    Once a section is half full it may also end after a page picked by its
+    content hash, so editing one page only changes the sections around it.
+    """
+    section = []
+    size = 0
+    for page in iter_document_pages(file_path, content_hash=content_hash):
+        page = normalize_page_text(page)
+        tokens = count_tokens(page)
+        if section and size + tokens > target_tokens:
+            yield "".join(section)
+            section, size = [], 0
+        section.append(page)
+        size += tokens
+        if size >= target_tokens or (size >= target_tokens // 2 and zlib.crc32(page.encode("utf-8")) % 4 == 0):
+            yield "".join(section)
+            section, size = [], 0
+    if section:
+        yield "".join(section)
+
+def summarize_section(text: str) -> str:
+    """Map step: short summary of one section (cached by its content like every LLM call)"""
+    messages = [
+        {
+            "role": "system",
+            "content": "You summarize one section of a research paper in at most 120 words. Keep the key methods, results and numbers. Return only the summary."
+        },
+        {
+            "role": "user",
+            "content": ""
+        }
+    ]
+    budget = route_budget("summarize_section", messages)
+    messages[1]["content"] = fit_text(text, budget, call_site="summarize_section")
     
-    return chunks
+    return chat_with_llm(
+        messages,
+        temperature=0.2,
+        call_site="summarize_section"
+    ).strip()
 
-def summarize_text(text: str, max_length: int = 500) -> str:
-    """Generate summary of text using LLM"""
+def summarize_sections(file_path: str, content_hash: str = None) -> list[str]:
+    """Summarize every section of a long document concurrently.
+
+    Returns [] when the whole document fits a single prompt. Sections whose
+    summary fails are left out rather than failing the document.
+    """
+    sections = iter_document_sections(file_path, content_hash=content_hash)
+
+    # Only read ahead until the document is known to need the map step
+    head = []
+    tokens = 0
+    for section in sections:
+        head.append(section)
+        tokens += count_tokens(section)
+        if tokens > SUMMARY_SINGLE_PASS_TOKENS:
+            break
+    else:
+        return []
+
+    summaries = []
+
+    def collect(future):
+        try:
+            summaries.append(future.result())
+        except Exception as e:
+            print(f"Section summary failed: {str(e)}")
+
+    # Bounded submit window: at most twice the pool size of sections are in
+    # memory at once, however long the document is
+    window = deque()
+    for section in chain(head, sections):
+        if len(window) >= SUMMARY_MAP_CONCURRENCY * 2:
+            collect(window.popleft())
+        window.append(_summary_pool.submit(summarize_section, section))
+    while window:
+        collect(window.popleft())
+    return [summary for summary in summaries if summary]
+
+def _paper_content(text: str, section_summaries: list[str], budget: int, call_site: str) -> str:
+    """Prompt body for a paper: its text, or its opening plus per-section summaries"""
+    if not section_summaries:
+        return fit_text(text, budget, call_site=call_site)
+    # The opening holds title, authors and abstract; the summaries cover the rest
+    opening = fit_text(text, min(600, budget // 4), call_site=call_site)
+    summaries = pack_evenly(section_summaries, budget - count_tokens(opening) - 16, call_site=call_site)
+    return f"Opening of the paper:\n{opening}\n\nSummaries of each section, in order:\n" + "\n\n".join(summaries)
+
+def summarize_text(text: str, max_length: int = 500, section_summaries: list[str] = None) -> str:
+    """Generate summary of text using LLM.
+
+    With section_summaries (from summarize_sections) this is the reduce step
+    of map-reduce summarization and covers the whole paper, not just its start.
+    """
     try:
-        # Truncate if too long
-        text_to_summarize = text[:4000] if len(text) > 4000 else text
-        
         messages = [
             {
                 "role": "system",
@@ -45,27 +322,26 @@ def summarize_text(text: str, max_length: int = 500) -> str:
             },
             {
                 "role": "user",
-                "content": f"Summarize this research paper in {max_length} words or less:\n\n{text_to_summarize}"
+                "content": f"Summarize this research paper in {max_length} words or less:\n\n"
             }
         ]
+        # Pack as much of the paper as the budget allows
+        budget = route_budget("summarize", messages)
+        messages[1]["content"] += _paper_content(text, section_summaries, budget, "summarize")
         
-        response = client.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
+        result = chat_with_llm(
+            messages,
             temperature=0.3,
-            max_tokens=1024
+            call_site="summarize"
         )
         
-        return response.choices[0].message.content
+        return result
     except Exception as e:
         return f"Summary generation failed: {str(e)}"
 
 def extract_metadata_from_pdf(text: str) -> dict:
     """Extract title and authors from PDF text using LLM"""
     try:
-        # Use first 2000 characters for metadata extraction
-        text_sample = text[:2000]
-        
         messages = [
             {
                 "role": "system",
@@ -73,19 +349,19 @@ def extract_metadata_from_pdf(text: str) -> dict:
             },
             {
                 "role": "user",
-                "content": text_sample
+                "content": ""
             }
         ]
+        # Title and authors are on the first page - only the start is needed
+        budget = route_budget("metadata", messages)
+        messages[1]["content"] = fit_text(text, budget, call_site="metadata")
         
-        response = client.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
+        result = chat_with_llm(
+            messages,
             temperature=0.1,
-            max_tokens=256
+            call_site="metadata"
         )
         
-        result = response.choices[0].message.content
-        
         # Parse response
         title = "Unknown"
         authors = "Unknown"
@@ -100,16 +376,20 @@ def extract_metadata_from_pdf(text: str) -> dict:
     except:
         return {"title": "Unknown", "authors": "Unknown"}
 
+RESEARCH_CATEGORIES = [
+    "Machine Learning", "Artificial Intelligence", "Climate Science", "Medical Research",
+    "Physics", "Chemistry", "Biology", "Computer Science", "Mathematics",
+    "Social Science", "Engineering", "Other"
+]
+
 def extract_category_and_tags(text: str, summary: str) -> dict:
     """Extract research category and relevant tags using AI"""
     try:
-        text_sample = text[:3000] if len(text) > 3000 else text
-        
         messages = [
             {
                 "role": "system",
-                "content": """You are a research categorization expert. Analyze the research paper and:
-1. Assign ONE primary category from: Machine Learning, Artificial Intelligence, Climate Science, Medical Research, Physics, Chemistry, Biology, Computer Science, Mathematics, Social Science, Engineering, Other
+                "content": f"""You are a research categorization expert. Analyze the research paper and:
+1. Assign ONE primary category from: {", ".join(RESEARCH_CATEGORIES)}
 2. Generate 3-5 relevant tags (keywords) that describe the research
 
 Return ONLY in this exact format:
@@ -118,19 +398,19 @@ Tags: [tag1, tag2, tag3, tag4, tag5]"""
             },
             {
                 "role": "user",
-                "content": f"Paper Summary: {summary}\n\nPaper Excerpt: {text_sample}"
+                "content": f"Paper Summary: {summary}\n\nPaper Excerpt: "
             }
         ]
+        # The summary is kept whole; the excerpt gets whatever budget is left
+        budget = route_budget("category", messages)
+        messages[1]["content"] += fit_text(text, budget, call_site="category")
         
-        response = client.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
+        result = chat_with_llm(
+            messages,
             temperature=0.2,
-            max_tokens=256
+            call_site="category"
         )
         
-        result = response.choices[0].message.content
-        
         # Parse response
         category = "Other"
         tags = []
@@ -147,57 +427,353 @@ Tags: [tag1, tag2, tag3, tag4, tag5]"""
         print(f"Category/tag extraction failed: {str(e)}")
         return {"category": "Other", "tags": ""}
 
-def detect_common_theme(summaries: list[str]) -> str:
-    """Detect common research theme across multiple papers to suggest project name"""
+def _normalize_category(category: str) -> str:
+    """Match case-insensitively against RESEARCH_CATEGORIES, anything else becomes Other"""
+    category = str(category or "").strip()
+    return next((c for c in RESEARCH_CATEGORIES if c.lower() == category.lower()), "Other")
+
+def _category_batch_messages(summaries: list[str]) -> list:
+    papers = "\n\n".join(f"[{i + 1}] {summary}" for i, summary in enumerate(summaries))
+    return [
+        {
+            "role": "system",
+            "content": f"""You are a research categorization expert. For EACH numbered paper summary:
+1. Assign ONE primary category from: {", ".join(RESEARCH_CATEGORIES)}
+2. Generate 3-5 relevant tags (keywords) that describe the research
+
+Return ONLY a JSON object of the form:
+{{"papers": [{{"id": 1, "category": "...", "tags": ["...", "..."]}}, ...]}}
+with one entry per paper, using the paper numbers as ids."""
+        },
+        {
+            "role": "user",
+            "content": papers
+        }
+    ]
+
+def _plan_category_batches(summaries: list[str]) -> list[list[int]]:
+    """Group paper indexes into batches that fit the category_batch token budget"""
+    budget = route_budget("category_batch", _category_batch_messages([]))
+    output_limit = route_for("category_batch")["max_tokens"]
+    batches = []
+    batch = []
+    size = 0
+    for i, summary in enumerate(summaries):
+        tokens = count_tokens(summary) + 8
+        if batch and (size + tokens > budget or (len(batch) + 1) * CATEGORY_BATCH_OUTPUT_TOKENS > output_limit):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(i)
+        size += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def categorize_batch(summaries: list[str]) -> list:
+    """Category and tags for several papers in one JSON-mode call.
+
+    Returns one {"category", "tags"} dict per summary, or None for papers the
+    response left out or got wrong.
+    """
+    messages = _category_batch_messages(summaries)
+    result = chat_with_llm(
+        messages,
+        temperature=0.2,
+        max_tokens=len(summaries) * CATEGORY_BATCH_OUTPUT_TOKENS + 64,
+        response_format={"type": "json_object"},
+        call_site="category_batch"
+    )
+    
+    entries = json.loads(result).get("papers", [])
+    by_id = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        tags = entry.get("tags")
+        if isinstance(tags, str):
+            tags = tags.split(",")
+        if not isinstance(tags, list):
+            continue
+        tags = [str(tag).strip() for tag in tags if str(tag).strip()][:5]
+        if tags and entry.get("category"):
+            by_id[str(entry.get("id"))] = {"category": _normalize_category(entry["category"]), "tags": ", ".join(tags)}
+    return [by_id.get(str(i + 1)) for i in range(len(summaries))]
+
+def categorize_papers(summaries: list[str]) -> list[dict]:
+    """Category and tags for many papers at a fraction of the per-paper call count.
+
+    Summaries are packed into as few categorize_batch calls as the token
+    budget allows, run concurrently. Papers a batch fails on fall back to
+    extract_category_and_tags.
+    """
+    summaries = [fit_text(summary or "", CATEGORY_BATCH_SUMMARY_TOKENS, call_site="category_batch") for summary in summaries]
+    batches = _plan_category_batches(summaries)
+
+    def run(batch):
+        try:
+            return categorize_batch([summaries[i] for i in batch])
+        except Exception as e:
+            print(f"Batched categorization failed for {len(batch)} papers: {str(e)}")
+            return [None] * len(batch)
+
+    results = [None] * len(summaries)
+    for batch, batch_results in zip(batches, _summary_pool.map(run, batches)):
+        for i, result in zip(batch, batch_results):
+            results[i] = result or extract_category_and_tags("", summaries[i])
+    return results
+
+def _validate_enrichment(data) -> dict:
+    """Check the fused enrichment JSON and normalize it to the Paper field formats"""
+    if not isinstance(data, dict):
+        raise ValueError("Enrichment result is not a JSON object")
+
+    def text_field(name):
+        value = data.get(name)
+        if isinstance(value, list):
+            value = ", ".join(str(v).strip() for v in value if str(v).strip())
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"Missing or empty field: {name}")
+        return value.strip()
+
+    title = text_field("title")
+    authors = text_field("authors")
+    summary = text_field("summary")
+
+    category = _normalize_category(text_field("category"))
+
+    tags = data.get("tags")
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    if not isinstance(tags, list):
+        raise ValueError("Field 'tags' must be a list")
+    tags = [str(tag).strip() for tag in tags if str(tag).strip()][:5]
+    if not tags:
+        raise ValueError("Field 'tags' is empty")
+
+    return {
+        "title": title,
+        "authors": authors,
+        "summary": summary,
+        "category": category,
+        "tags": ", ".join(tags)
+    }
+
+def enrich_paper(text: str, max_length: int = 500, section_summaries: list[str] = None) -> dict:
+    """Extract title, authors, summary, category and tags in a single LLM call.
+
+    section_summaries (from summarize_sections) make this the reduce step of
+    map-reduce summarization for long papers.
+    Falls back to the separate metadata / summary / category calls if the
+    response is not valid JSON or fails validation.
+    """
     try:
-        combined = "\n\n".join(summaries[:5])  # Limit to first 5 for performance
-        
         messages = [
             {
                 "role": "system",
-                "content": "You are a research analyst. Analyze these paper summaries and suggest a SHORT (2-4 words) project name that captures the common theme. Return ONLY the project name, nothing else."
+                "content": f"""You are a research paper analyst. From the paper text, return ONLY a JSON object with these keys:
+"title": the paper title
+"authors": the authors as one comma-separated string
+"summary": a concise, informative summary in {max_length} words or less
+"category": ONE primary category from: {", ".join(RESEARCH_CATEGORIES)}
+"tags": a list of 3-5 relevant keywords describing the research
+Use "Unknown" for a title or authors that cannot be found."""
             },
             {
                 "role": "user",
-                "content": f"Paper summaries:\n\n{combined}"
+                "content": ""
             }
         ]
+        budget = route_budget("enrich", messages)
+        messages[1]["content"] = _paper_content(text, section_summaries, budget, "enrich")
         
-        response = client.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
+        result = chat_with_llm(
+            messages,
+            temperature=0.2,
+            response_format={"type": "json_object"},
+            call_site="enrich"
+        )
+        
+        return _validate_enrichment(json.loads(result))
+    except Exception as e:
+        print(f"Fused enrichment failed, falling back to per-field calls: {str(e)}")
+        metadata = extract_metadata_from_pdf(text)
+        summary = summarize_text(text, max_length=max_length, section_summaries=section_summaries)
+        cat_tags = extract_category_and_tags(text, summary)
+        return {**metadata, "summary": summary, **cat_tags}
+
+def _theme_messages(summaries: list[str]) -> list:
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a research analyst. Analyze these paper summaries and suggest a SHORT (2-4 words) project name that captures the common theme. Return ONLY the project name, nothing else."
+        },
+        {
+            "role": "user",
+            "content": "Paper summaries:\n\n"
+        }
+    ]
+    # Every paper gets a say; long summaries are shortened first
+    budget = route_budget("theme", messages)
+    messages[1]["content"] += "\n\n".join(pack_evenly(summaries, budget, call_site="theme"))
+    return messages
+
+def detect_common_theme(summaries: list[str]) -> str:
+    """Detect common research theme across multiple papers to suggest project name"""
+    try:
+        result = chat_with_llm(
+            _theme_messages(summaries),
             temperature=0.3,
-            max_tokens=50
+            call_site="theme"
         )
         
-        return response.choices[0].message.content.strip()
+        return result.strip()
     except Exception as e:
         print(f"Theme detection failed: {str(e)}")
         return "Research Collection"
-def generate_synthesized_report(summaries: list[str]) -> str:
-    """Synthesize multiple research paper summaries into a coherent report"""
+
+async def detect_common_theme_async(summaries: list[str]) -> str:
+    """Async version of detect_common_theme"""
     try:
-        combined_text = "\n\n---\n\n".join(summaries)
-        
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a senior research analyst. Synthesize the provided research summaries into a coherent, organized research report. Highlight common themes, conflicting findings, and unique contributions. Use professional language and Markdown formatting."
-            },
-            {
-                "role": "user",
-                "content": f"Please synthesize an executive research report from these individual paper summaries:\n\n{combined_text}"
-            }
-        ]
+        result = await chat_with_llm_async(
+            _theme_messages(summaries),
+            temperature=0.3,
+            call_site="theme"
+        )
         
-        response = client.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
+        return result.strip()
+    except Exception as e:
+        print(f"Theme detection failed: {str(e)}")
+        return "Research Collection"
+
+def _synthesis_messages(summaries: list[str]) -> list:
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a senior research analyst. Synthesize the provided research summaries into a coherent, organized research report. Highlight common themes, conflicting findings, and unique contributions. Use professional language and Markdown formatting."
+        },
+        {
+            "role": "user",
+            "content": "Please synthesize an executive research report from these individual paper summaries:\n\n"
+        }
+    ]
+    budget = route_budget("synthesis", messages)
+    messages[1]["content"] += "\n\n---\n\n".join(pack_evenly(summaries, budget, call_site="synthesis"))
+    return messages
+
+def _synthesis_node_messages(summaries: list[str]) -> list:
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a senior research analyst. Condense the provided research summaries into one synthesis of at most 400 words that preserves common themes, conflicting findings, unique contributions and the titles of the papers behind them. Return only the synthesis."
+        },
+        {
+            "role": "user",
+            "content": "Summaries:\n\n"
+        }
+    ]
+    budget = route_budget("synthesis_node", messages)
+    messages[1]["content"] += "\n\n---\n\n".join(pack_evenly(summaries, budget, call_site="synthesis_node"))
+    return messages
+
+def _content_key(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+
+def _group_for_reduction(items: list[str], budget: int, fanout: int = None) -> list[list[str]]:
+    """Split items into groups that each fit one tree-node prompt.
+
+    Items are ordered by content hash and, with a fanout, a group also ends
+    after any item whose hash is divisible by it. Adding one item therefore
+    only changes the group it lands in; every other node stays cached.
+    """
+    groups = []
+    group = []
+    size = 0
+    for item in sorted(items, key=_content_key):
+        tokens = count_tokens(item) + 8
+        if group and size + tokens > budget:
+            groups.append(group)
+            group, size = [], 0
+        group.append(item)
+        size += tokens
+        if fanout and _content_key(item) % fanout == 0:
+            groups.append(group)
+            group, size = [], 0
+    if group:
+        groups.append(group)
+    return groups
+
+def _plan_reduction(items: list[str]):
+    """Groups for the next tree level, or None once items fit the final report prompt"""
+    final_budget = route_budget("synthesis", _synthesis_messages([]))
+    if sum(count_tokens(item) + 8 for item in items) <= final_budget:
+        return None
+    node_budget = route_budget("synthesis_node", _synthesis_node_messages([]))
+    groups = _group_for_reduction(items, node_budget, fanout=SYNTHESIS_FANOUT)
+    if len(groups) == len(items):
+        # Content boundaries made no progress - group by size only
+        groups = _group_for_reduction(items, node_budget)
+    if len(groups) == len(items):
+        # Every item fills a node on its own; the final prompt compresses them
+        return None
+    return groups
+
+def _synthesize_group(group: list[str]) -> str:
+    if len(group) == 1:
+        return group[0]
+    return chat_with_llm(
+        _synthesis_node_messages(group),
+        temperature=0.3,
+        call_site="synthesis_node"
+    )
+
+async def _synthesize_group_async(group: list[str]) -> str:
+    if len(group) == 1:
+        return group[0]
+    return await chat_with_llm_async(
+        _synthesis_node_messages(group),
+        temperature=0.3,
+        call_site="synthesis_node"
+    )
+
+def generate_synthesized_report(summaries: list[str]) -> str:
+    """Synthesize multiple research paper summaries into a coherent report.
+
+    Summaries that do not fit one prompt are reduced as a tree: groups are
+    condensed in parallel, level by level, until the result fits. Nodes are
+    cached by their inputs, so a changed paper set only recomputes the
+    nodes on the path of what changed.
+    """
+    try:
+        items = summaries
+        while True:
+            groups = _plan_reduction(items)
+            if groups is None:
+                break
+            items = list(_summary_pool.map(_synthesize_group, groups))
+        
+        return chat_with_llm(
+            _synthesis_messages(items),
             temperature=0.4,
-            max_tokens=2048
+            call_site="synthesis"
+        )
+    except Exception as e:
+        return f"Synthesis failed: {str(e)}"
+
+async def generate_synthesized_report_async(summaries: list[str]) -> str:
+    """Async version of generate_synthesized_report"""
+    try:
+        items = summaries
+        while True:
+            groups = _plan_reduction(items)
+            if groups is None:
+                break
+            items = await asyncio.gather(*(_synthesize_group_async(group) for group in groups))
+        
+        return await chat_with_llm_async(
+            _synthesis_messages(items),
+            temperature=0.4,
+            call_site="synthesis"
         )
-        
-        return response.choices[0].message.content
     except Exception as e:
         return f"Synthesis failed: {str(e)}"
 
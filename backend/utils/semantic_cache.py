@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from utils.vectordb import chroma_client
+from utils.embeddings import embed_texts
+
+load_dotenv()
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity a cached question needs to count as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+# "user" keeps answers private to each user, "global" shares them
+SEMANTIC_CACHE_SCOPE = os.getenv("SEMANTIC_CACHE_SCOPE", "user")
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 86400))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+
+# Lookups this far below the threshold are counted as near misses, to tune it
+NEAR_MISS_MARGIN = 0.05
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256((context or "").encode("utf-8")).hexdigest()
+
+class SemanticCache:
+    """Answers keyed by the meaning of the question rather than its exact text.
+
+    Questions are embedded into their own Chroma collection. A lookup hits
+    when a question with the same scope and context is within the similarity
+    threshold and has not expired. Questions are embedded by the local
+    embedding engine; Chroma's own default embedder is only used when that
+    is unavailable. Chroma calls block - use from threads.
+    """
+
+    def __init__(self, name: str = "semantic_answer_cache", threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 scope: str = SEMANTIC_CACHE_SCOPE, ttl: int = SEMANTIC_CACHE_TTL, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.collection = chroma_client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+        self.threshold = threshold
+        self.scope = scope
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "near_misses": 0, "stores": 0, "evictions": 0}
+        self.hit_similarity_total = 0.0
+
+    def _scope_key(self, user_id) -> str:
+        if self.scope == "user" and user_id is not None:
+            return f"user:{user_id}"
+        return "global"
+
+    def _count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def get(self, query: str, context: str = "", user_id: int = None):
+        """Cached answer for a question similar enough to query, or None"""
+        self._count("lookups")
+        embeddings = embed_texts([query], use_cache=False)
+        query_input = {"query_embeddings": embeddings} if embeddings is not None else {"query_texts": [query]}
+        results = self.collection.query(
+            **query_input,
+            n_results=1,
+            where={"$and": [
+                {"scope": self._scope_key(user_id)},
+                {"context_hash": context_hash(context)},
+                {"expires_at": {"$gt": time.time()}}
+            ]},
+            include=["metadatas", "distances"]
+        )
+        if not results["ids"] or not results["ids"][0]:
+            self._count("misses")
+            return None
+
+        similarity = 1 - results["distances"][0][0]
+        if similarity < self.threshold:
+            self._count("misses")
+            if similarity >= self.threshold - NEAR_MISS_MARGIN:
+                self._count("near_misses")
+            return None
+
+        metadata = results["metadatas"][0][0]
+        self.collection.update(ids=[results["ids"][0][0]], metadatas=[{**metadata, "last_hit": time.time()}])
+        with self.lock:
+            self.counters["hits"] += 1
+            self.hit_similarity_total += similarity
+        return metadata["answer"]
+
+    def set(self, query: str, answer: str, context: str = "", user_id: int = None):
+        scope = self._scope_key(user_id)
+        digest = context_hash(context)
+        now = time.time()
+        entry_id = hashlib.sha256(f"{scope}:{digest}:{query}".encode("utf-8")).hexdigest()
+        embeddings = embed_texts([query], use_cache=False)
+        self.collection.upsert(
+            ids=[entry_id],
+            documents=[query],
+            **({"embeddings": embeddings} if embeddings is not None else {}),
+            metadatas=[{
+                "scope": scope,
+                "context_hash": digest,
+                "answer": answer,
+                "created_at": now,
+                "last_hit": now,
+                "expires_at": now + self.ttl
+            }]
+        )
+        self._count("stores")
+        if self.collection.count() > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones down to 90% of max_entries"""
+        entries = self.collection.get(include=["metadatas"])
+        now = time.time()
+        expired = [i for i, m in zip(entries["ids"], entries["metadatas"]) if m["expires_at"] <= now]
+        live = sorted(
+            ((m["last_hit"], i) for i, m in zip(entries["ids"], entries["metadatas"]) if m["expires_at"] > now)
+        )
+        excess = len(live) - int(self.max_entries * 0.9)
+        doomed = expired + [i for _, i in live[:max(excess, 0)]]
+        if doomed:
+            self.collection.delete(ids=doomed)
+            self._count("evictions", len(doomed))
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.counters["lookups"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "avg_hit_similarity": self.hit_similarity_total / self.counters["hits"] if self.counters["hits"] else None,
+                "threshold": self.threshold,
+                "scope": self.scope,
+                "entries": self.collection.count(),
+            }
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+# Single-flight: while a call for a key is in progress, identical calls wait
+# for it and share its result instead of issuing their own.
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesces identical concurrent calls made from threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"calls": self.leaders, "coalesced": self.coalesced, "in_flight": len(self.calls)}
+
+class AsyncSingleFlight:
+    """Coalesces identical concurrent calls made from coroutines on one event loop.
+
+    The upstream call runs in its own task, so one caller being cancelled does
+    not cancel it for the others.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, coro_fn):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self.tasks[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda _: self.tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.leaders, "coalesced": self.coalesced, "in_flight": len(self.tasks)}
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import uuid
+import zlib
+
+# Disk cache of extracted PDF text, keyed by file content hash.
+#
+# Each entry is two files:
+#   <hash>.bin  - every page compressed separately with zlib, back to back
+#   <hash>.idx  - JSON list of [offset, length] per page into the .bin file
+# so a single page can be read with one seek + decompress. The index is
+# written last; an entry without one is incomplete and never read.
+
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", "text_cache")
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+COMPRESSION_LEVEL = 6
+
+os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+
+_evict_lock = threading.Lock()
+
+class CacheMiss(Exception):
+    """The entry is not (or no longer) cached - e.g. evicted after a has_text check"""
+
+def _data_path(content_hash: str) -> str:
+    return os.path.join(TEXT_CACHE_DIR, f"{content_hash}.bin")
+
+def _index_path(content_hash: str) -> str:
+    return os.path.join(TEXT_CACHE_DIR, f"{content_hash}.idx")
+
+def _load_index(content_hash: str):
+    try:
+        with open(_index_path(content_hash)) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    # Index mtime doubles as the LRU timestamp
+    try:
+        os.utime(_index_path(content_hash))
+    except OSError:
+        pass
+    return index
+
+def has_text(content_hash: str) -> bool:
+    """Check whether extracted text for this content is cached"""
+    return os.path.exists(_index_path(content_hash))
+
+def page_count(content_hash: str):
+    """Number of cached pages, or None if the content is not cached"""
+    index = _load_index(content_hash)
+    return len(index["pages"]) if index else None
+
+def read_page(content_hash: str, page_number: int):
+    """Read a single page without decompressing the rest of the document"""
+    index = _load_index(content_hash)
+    if index is None or not 0 <= page_number < len(index["pages"]):
+        return None
+    offset, length = index["pages"][page_number]
+    try:
+        with open(_data_path(content_hash), "rb") as f:
+            f.seek(offset)
+            return zlib.decompress(f.read(length)).decode("utf-8")
+    except (FileNotFoundError, zlib.error):
+        return None
+
+def iter_pages(content_hash: str):
+    """Cached pages in order, decompressed one at a time.
+
+    The entry is opened up front and CacheMiss raised right away if it is
+    gone, so callers can re-extract instead of reading an empty document.
+    Once open, eviction no longer affects the read.
+    """
+    index = _load_index(content_hash)
+    if index is None:
+        raise CacheMiss(content_hash)
+    try:
+        f = open(_data_path(content_hash), "rb")
+    except FileNotFoundError:
+        raise CacheMiss(content_hash)
+    return _read_pages(f, index["pages"])
+
+def _read_pages(f, pages: list):
+    with f:
+        for offset, length in pages:
+            f.seek(offset)
+            yield zlib.decompress(f.read(length)).decode("utf-8")
+
+class PageCacheWriter:
+    """Append pages for one document; nothing is visible to readers until commit()"""
+
+    def __init__(self, content_hash: str):
+        self.content_hash = content_hash
+        self.suffix = f".{uuid.uuid4().hex}.tmp"
+        self.data_tmp = _data_path(content_hash) + self.suffix
+        self.file = open(self.data_tmp, "wb")
+        self.pages = []
+        self.offset = 0
+
+    def add(self, text: str):
+        blob = zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+        self.file.write(blob)
+        self.pages.append([self.offset, len(blob)])
+        self.offset += len(blob)
+
+    def commit(self):
+        self.file.close()
+        index_tmp = _index_path(self.content_hash) + self.suffix
+        with open(index_tmp, "w") as f:
+            json.dump({"pages": self.pages, "bytes": self.offset}, f)
+        os.replace(self.data_tmp, _data_path(self.content_hash))
+        os.replace(index_tmp, _index_path(self.content_hash))
+        evict_to_size()
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.data_tmp):
+            os.remove(self.data_tmp)
+
+def delete_text(content_hash: str):
+    """Remove a cached entry"""
+    for path in (_index_path(content_hash), _data_path(content_hash)):
+        if os.path.exists(path):
+            os.remove(path)
+
+def evict_to_size(max_bytes: int = TEXT_CACHE_MAX_BYTES):
+    """Drop least recently used entries until the cache fits in max_bytes"""
+    with _evict_lock:
+        entries = []
+        total = 0
+        for name in os.listdir(TEXT_CACHE_DIR):
+            if not name.endswith(".idx"):
+                continue
+            content_hash = name[:-4]
+            try:
+                used = os.path.getmtime(_index_path(content_hash))
+                size = os.path.getsize(_data_path(content_hash)) + os.path.getsize(_index_path(content_hash))
+            except OSError:
+                continue
+            entries.append((used, size, content_hash))
+            total += size
+
+        for used, size, content_hash in sorted(entries):
+            if total <= max_bytes:
+                break
+            delete_text(content_hash)
+            total -= size
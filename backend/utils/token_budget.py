@@ -0,0 +1,205 @@
+import math
+import os
+import re
+import threading
+from collections import defaultdict, deque
+from dotenv import load_dotenv
+from utils.model_router import route_for
+
+load_dotenv()
+
+# "heuristic" works fully offline. "tiktoken" needs the optional package and its
+# cached encoding files; it falls back to the heuristic if either is missing.
+TOKENIZER = os.getenv("TOKENIZER", "heuristic")
+
+# Context window per model (input + output tokens)
+MODEL_CONTEXT_LIMITS = {
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "meta-llama/llama-4-scout-17b-16e-instruct": 131072,
+}
+DEFAULT_CONTEXT_LIMIT = 8192
+
+# Whole-prompt input budget per call site. Far below the context windows on
+# purpose: every prompt token also counts against the Groq tokens/min limit.
+PROMPT_BUDGETS = {
+    "chat": 4000,
+    "vision": 3000,
+    "trends": 2000,
+    "metadata": 600,
+    "summarize": 2500,
+    "summarize_section": 2300,
+    "category": 1200,
+    "category_batch": 6000,
+    "enrich": 2500,
+    "theme": 1500,
+    "synthesis": 8000,
+    "synthesis_node": 6000,
+}
+
+# Per-message framing tokens and a flat cost per attached image
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = 1000
+SAFETY_MARGIN_TOKENS = 64
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d+|\S")
+
+def _load_tiktoken():
+    if TOKENIZER != "tiktoken":
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken unavailable, using heuristic token counts: {str(e)}")
+        return None
+
+_encoding = _load_tiktoken()
+
+def _piece_cost(piece: str) -> int:
+    # Roughly matches Llama 3's BPE on English text, erring slightly high
+    if piece[0].isdigit():
+        return math.ceil(len(piece) / 3)
+    if piece[0].isalpha():
+        return math.ceil(len(piece) / 5)
+    return 1
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(_piece_cost(m.group()) for m in _TOKEN_RE.finditer(text))
+
+def count_message_tokens(messages: list) -> int:
+    """Prompt tokens of a chat completion request, including message framing"""
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            total += count_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    total += count_tokens(part.get("text", ""))
+                else:
+                    total += IMAGE_TOKENS
+    return total
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "start") -> str:
+    """Cut text to at most max_tokens, keeping its start (default) or its end"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        kept = tokens[:max_tokens] if keep == "start" else tokens[-max_tokens:]
+        return _encoding.decode(kept)
+
+    matches = list(_TOKEN_RE.finditer(text))
+    if keep != "start":
+        matches.reverse()
+    used = 0
+    for m in matches:
+        used += _piece_cost(m.group())
+        if used > max_tokens:
+            return text[:m.start()].rstrip() if keep == "start" else text[m.end():].lstrip()
+    return text
+
+def budget_for(call_site: str, model: str, max_tokens: int, fixed_messages: list = None) -> int:
+    """Tokens left for variable content once the fixed prompt and the output are reserved"""
+    context_limit = MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT)
+    limit = context_limit - max_tokens - SAFETY_MARGIN_TOKENS
+    if call_site in PROMPT_BUDGETS:
+        limit = min(limit, PROMPT_BUDGETS[call_site])
+    return max(0, limit - count_message_tokens(fixed_messages or []))
+
+def route_budget(call_site: str, fixed_messages: list = None) -> int:
+    """budget_for the model and output size MODEL_ROUTES picks for call_site"""
+    route = route_for(call_site)
+    return budget_for(call_site, route["model"], route["max_tokens"], fixed_messages)
+
+def fit_text(text: str, budget: int, call_site: str = "default", keep: str = "start") -> str:
+    """truncate_to_tokens that records how much content the budget cut off"""
+    fitted = truncate_to_tokens(text, budget, keep=keep)
+    if len(fitted) < len(text):
+        token_usage.record_trim(call_site, count_tokens(text) - count_tokens(fitted))
+    return fitted
+
+def pack_evenly(texts: list[str], budget: int, call_site: str = "default", separator_tokens: int = 4, min_item_tokens: int = 48) -> list[str]:
+    """Fit equally valuable texts into budget, compressing the longest ones first.
+
+    Texts shorter than the fair share stay whole and their unused share goes to
+    the rest. If even min_item_tokens each does not fit, texts are dropped from
+    the end of the list.
+    """
+    texts = [t for t in texts if t]
+    while texts and len(texts) * (min_item_tokens + separator_tokens) > budget:
+        texts = texts[:-1]
+    if not texts:
+        return []
+
+    sizes = [count_tokens(t) for t in texts]
+    remaining = budget - separator_tokens * len(texts)
+    # Water-filling: settle the short texts, then split what is left
+    pending = sorted(range(len(texts)), key=lambda i: sizes[i])
+    caps = {}
+    for position, i in enumerate(pending):
+        share = remaining // (len(pending) - position)
+        caps[i] = min(sizes[i], share)
+        remaining -= caps[i]
+
+    packed = []
+    for i, text in enumerate(texts):
+        packed.append(text if caps[i] >= sizes[i] else truncate_to_tokens(text, caps[i]))
+    dropped = sum(sizes) - sum(caps.values())
+    if dropped > 0:
+        token_usage.record_trim(call_site, dropped)
+    return packed
+
+class TokenUsage:
+    """Tokens used per LLM call: counted prompt size vs. what Groq reports"""
+
+    def __init__(self, recent: int = 100):
+        self.lock = threading.Lock()
+        self.by_site = defaultdict(lambda: {
+            "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "estimated_prompt_tokens": 0, "trimmed_calls": 0, "trimmed_tokens": 0
+        })
+        self.recent = deque(maxlen=recent)
+
+    def record_call(self, call_site: str, model: str, estimated_prompt_tokens: int, usage):
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        with self.lock:
+            site = self.by_site[call_site]
+            site["calls"] += 1
+            site["prompt_tokens"] += prompt_tokens
+            site["completion_tokens"] += completion_tokens
+            site["estimated_prompt_tokens"] += estimated_prompt_tokens
+            self.recent.append({
+                "call_site": call_site,
+                "model": model,
+                "estimated_prompt_tokens": estimated_prompt_tokens,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+            })
+
+    def record_trim(self, call_site: str, tokens: int):
+        with self.lock:
+            site = self.by_site[call_site]
+            site["trimmed_calls"] += 1
+            site["trimmed_tokens"] += tokens
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "by_call_site": {site: dict(counts) for site, counts in self.by_site.items()},
+                "recent_calls": list(self.recent),
+                "tokenizer": "tiktoken" if _encoding is not None else "heuristic",
+            }
+
+token_usage = TokenUsage()
@@ -2,41 +2,218 @@
 import chromadb
 from chromadb.config import Settings
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.embeddings import embed_texts
+from utils.bm25 import BM25Index, bm25_build_seconds, reciprocal_rank_fusion
 
 # Initialize ChromaDB client
 chroma_client = chromadb.PersistentClient(path="./chroma_db")
 
-# Get or create collection for research papers
-papers_collection = chroma_client.get_or_create_collection(
-    name="research_papers",
-    metadata={"description": "Vector embeddings of research papers"}
-)
+# One collection per user, so a search only walks that user's own chunks
+# and can never return another user's papers
+_user_collections = {}
+_collections_lock = threading.Lock()
 
-def add_paper_to_vectordb(paper_id: int, chunks: list[str], metadatas: list[dict]):
-    """Add paper chunks to vector database"""
-    ids = [f"paper_{paper_id}_chunk_{i}" for i in range(len(chunks))]
-    papers_collection.add(
-        documents=chunks,
-        metadatas=metadatas,
-        ids=ids
-    )
+def user_collection(user_id: int):
+    """Get or create the collection holding one user's paper chunks"""
+    with _collections_lock:
+        collection = _user_collections.get(user_id)
+        if collection is None:
+            collection = chroma_client.get_or_create_collection(
+                name=f"research_papers_user_{user_id}",
+                metadata={"description": f"Vector embeddings of research papers of user {user_id}"}
+            )
+            _user_collections[user_id] = collection
+        return collection
 
-def search_papers(query: str, n_results: int = 5):
-    """Search for relevant paper chunks"""
-    results = papers_collection.query(
-        query_texts=[query],
-        n_results=n_results
+# Number of chunks embedded and written per collection.add call
+# Larger batches give the embedding engine more chunks to sort by length
+VECTOR_BATCH_SIZE = int(os.getenv("VECTOR_BATCH_SIZE", 256))
+
+# Hybrid search: candidates taken from each retriever before rank fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Keyword (BM25) index per user, kept in step with the user's collection
+_bm25_indexes = {}
+_bm25_lock = threading.Lock()
+_retrieval_pool = ThreadPoolExecutor(max_workers=4)
+
+def bm25_index(user_id: int) -> BM25Index:
+    """The user's keyword index, built from their collection on first use"""
+    with _bm25_lock:
+        index = _bm25_indexes.get(user_id)
+        if index is not None:
+            return index
+        index = BM25Index()
+        # Held through the build, so adds and searches arriving meanwhile wait for it
+        index.lock.acquire()
+        _bm25_indexes[user_id] = index
+
+    try:
+        started = time.monotonic()
+        collection = user_collection(user_id)
+        # Page over a snapshot of the IDs rather than by offset: a paper deleted
+        # mid-build would shift the offsets and make later pages skip live chunks.
+        # Chunks deleted after the snapshot are simply not returned, and the
+        # delete's remove_paper waits for this build to finish.
+        chunk_ids = collection.get(include=[])["ids"]
+        for start in range(0, len(chunk_ids), 1000):
+            page = collection.get(ids=chunk_ids[start:start + 1000], include=["documents", "metadatas"])
+            index.add(page["ids"], page["documents"], [metadata["paper_id"] for metadata in page["metadatas"]])
+        index.build_seconds = time.monotonic() - started
+        bm25_build_seconds.observe(index.build_seconds)
+    finally:
+        index.lock.release()
+    return index
+
+def _built_bm25_index(user_id: int):
+    """The user's keyword index if it has been built; otherwise its build will pick the change up"""
+    with _bm25_lock:
+        return _bm25_indexes.get(user_id)
+
+def bm25_stats() -> dict:
+    with _bm25_lock:
+        indexes = dict(_bm25_indexes)
+    return {user_id: index.stats() for user_id, index in indexes.items()}
+
+def add_paper_to_vectordb(user_id: int, paper_id: int, chunks: list[str], metadatas: list[dict], start_index: int = 0):
+    """Add paper chunks to the user's collection, embedded by the local embedding engine"""
+    collection = user_collection(user_id)
+    ids = [f"paper_{paper_id}_chunk_{start_index + i}" for i in range(len(chunks))]
+    embeddings = embed_texts(chunks)
+    if embeddings is None:
+        # sentence-transformers missing - Chroma embeds with its default function
+        collection.add(documents=chunks, metadatas=metadatas, ids=ids)
+    else:
+        collection.add(
+            documents=chunks,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    index = _built_bm25_index(user_id)
+    if index is not None:
+        index.add(ids, chunks, [paper_id] * len(ids))
+
+def add_paper_chunks_in_batches(user_id: int, paper_id: int, chunks, batch_size: int = VECTOR_BATCH_SIZE) -> list[str]:
+    """Consume a chunk iterator and flush it to the vector database in fixed-size batches.
+
+    Only one batch is held in memory at a time. Returns the IDs of the chunks added.
+    """
+    batch = []
+    count = 0
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            metadatas = [{"paper_id": paper_id, "chunk_index": count + i} for i in range(len(batch))]
+            add_paper_to_vectordb(user_id, paper_id, batch, metadatas, start_index=count)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        metadatas = [{"paper_id": paper_id, "chunk_index": count + i} for i in range(len(batch))]
+        add_paper_to_vectordb(user_id, paper_id, batch, metadatas, start_index=count)
+        count += len(batch)
+
+    return [f"paper_{paper_id}_chunk_{i}" for i in range(count)]
+
+def search_papers(user_id: int, query: str, n_results: int = 5, paper_ids: list[int] = None):
+    """Search for relevant chunks in the user's papers.
+
+    paper_ids restricts the search to those papers (e.g. one project,
+    category or tag) inside the query itself rather than afterwards.
+    """
+    if paper_ids is not None and not paper_ids:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+    collection = user_collection(user_id)
+    where = {"paper_id": {"$in": list(paper_ids)}} if paper_ids is not None else None
+    # Queries are one-off - keep them out of the chunk embedding cache
+    query_embeddings = embed_texts([query], use_cache=False)
+    if query_embeddings is None:
+        return collection.query(query_texts=[query], n_results=n_results, where=where)
+    results = collection.query(
+        query_embeddings=query_embeddings,
+        n_results=n_results,
+        where=where
     )
     return results
 
-def delete_paper_from_vectordb(paper_id: int):
-    """Delete all chunks of a paper from vector database"""
-    # Get all IDs for this paper
-    results = papers_collection.get(
-        where={"paper_id": paper_id}
+def hybrid_search(user_id: int, query: str, n_results: int = 5, paper_ids: list[int] = None):
+    """Vector and BM25 keyword search run concurrently, fused with reciprocal rank fusion.
+
+    Keyword matching catches exact terms embeddings blur (gene names,
+    dataset IDs, symbols). Returns the shape of search_papers, with fused
+    scores instead of distances.
+    """
+    if paper_ids is not None and not paper_ids:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "scores": [[]]}
+
+    candidates = max(n_results, HYBRID_CANDIDATES)
+    vector_future = _retrieval_pool.submit(search_papers, user_id, query, candidates, paper_ids)
+    keyword_future = _retrieval_pool.submit(lambda: bm25_index(user_id).search(query, candidates, paper_ids))
+    vector = vector_future.result()
+    keyword = keyword_future.result()
+
+    fused = reciprocal_rank_fusion([vector["ids"][0], [chunk_id for chunk_id, _ in keyword]], k=RRF_K)[:n_results]
+    found = {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(vector["ids"][0], vector["documents"][0], vector["metadatas"][0])
+    }
+    # Keyword-only hits still need their text
+    missing = [chunk_id for chunk_id, _ in fused if chunk_id not in found]
+    if missing:
+        extra = user_collection(user_id).get(ids=missing, include=["documents", "metadatas"])
+        found.update(zip(extra["ids"], zip(extra["documents"], extra["metadatas"])))
+
+    fused = [(chunk_id, score) for chunk_id, score in fused if chunk_id in found]
+    return {
+        "ids": [[chunk_id for chunk_id, _ in fused]],
+        "documents": [[found[chunk_id][0] for chunk_id, _ in fused]],
+        "metadatas": [[found[chunk_id][1] for chunk_id, _ in fused]],
+        "scores": [[score for _, score in fused]],
+    }
+
+def delete_paper_from_vectordb(user_id: int, paper_id: int):
+    """Delete all chunks of a paper from the user's collection"""
+    user_collection(user_id).delete(where={"paper_id": paper_id})
+    index = _built_bm25_index(user_id)
+    if index is not None:
+        index.remove_paper(paper_id)
+
+def copy_paper_chunks(source_user_id: int, source_paper_id: int, user_id: int, paper_id: int,
+                      batch_size: int = VECTOR_BATCH_SIZE) -> list[str]:
+    """Copy a paper's stored chunks and vectors to another paper, possibly in another user's collection.
+
+    Used for deduplicated uploads - the vectors are reused, nothing is re-embedded.
+    Returns the IDs of the new chunks.
+    """
+    source = user_collection(source_user_id)
+    target = user_collection(user_id)
+    results = source.get(where={"paper_id": source_paper_id}, include=["documents", "metadatas", "embeddings"])
+    rows = sorted(
+        zip(results["documents"], results["metadatas"], results["embeddings"]),
+        key=lambda row: row[1].get("chunk_index", 0)
     )
-    if results['ids']:
-        papers_collection.delete(ids=results['ids'])
+    ids = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        batch_ids = [f"paper_{paper_id}_chunk_{metadata.get('chunk_index', start + i)}" for i, (_, metadata, _) in enumerate(batch)]
+        target.add(
+            ids=batch_ids,
+            documents=[document for document, _, _ in batch],
+            metadatas=[{**metadata, "paper_id": paper_id} for _, metadata, _ in batch],
+            embeddings=[list(embedding) for _, _, embedding in batch]
+        )
+        index = _built_bm25_index(user_id)
+        if index is not None:
+            index.add(batch_ids, [document for document, _, _ in batch], [paper_id] * len(batch_ids))
+        ids.extend(batch_ids)
+    return ids
 =======
 import chromadb
 from chromadb.config import Settings
@@ -105,7 +105,7 @@ const LibraryPage = () => {
             const response = await api.post('/papers/upload-batch', formData, {
                 headers: { 'Content-Type': 'multipart/form-data' },
             });
-            const uploadedCount = response.data.length;
+            const uploadedCount = response.data.papers.length;
 
             setSelectedFiles(null);
             setFileTitles([]);